@@ -0,0 +1,86 @@
+""" Compare the streaming feed parser against feedparser on synthetic Open Search feeds.
+
+Run from the repository root: `python benchmarks/feed_parsing.py`. Requires feedparser (a dev package).
+
+"""
+
+import sys
+import time
+import pathlib
+import tracemalloc
+
+import feedparser
+
+sys.path.insert(0, str(pathlib.Path(__file__).parents[1]))
+
+import configuration.feeds as feeds  # noqa: E402
+
+ENTRY = '''<entry>
+<title>S2A_MSIL2A_20211001T093031_N0301_R136_T35VPG_{i:08d}</title>
+<link href="https://scihub.copernicus.eu/dhus/odata/v1/Products('{i:08d}-0000-0000-0000-000000000000')/$value"/>
+<id>{i:08d}-0000-0000-0000-000000000000</id>
+<summary>Date: 2021-10-01T09:30:31.024Z, Instrument: MSI, Satellite: Sentinel-2, Size: 1.05 GB</summary>
+<date name="beginposition">2021-10-01T09:30:31.024Z</date>
+<date name="endposition">2021-10-01T09:30:31.024Z</date>
+<date name="ingestiondate">2021-10-01T14:12:41.117Z</date>
+<double name="cloudcoverpercentage">12.5</double>
+<str name="footprint">MULTIPOLYGON (((30.0 59.0, 31.9 59.0, 31.9 60.0, 30.0 60.0, 30.0 59.0)))</str>
+<str name="size">1.05 GB</str>
+<str name="platformname">Sentinel-2</str>
+<str name="producttype">S2MSI2A</str>
+<bool name="online">true</bool>
+</entry>
+'''
+
+FEED = '''<?xml version="1.0" encoding="utf-8"?>
+<feed xmlns:opensearch="http://a9.com/-/spec/opensearch/1.1/" xmlns="http://www.w3.org/2005/Atom">
+<opensearch:totalResults>{rows}</opensearch:totalResults>
+{entries}</feed>
+'''
+
+
+def generate_feed(rows):
+    """ Generate an Open Search feed with the given number of entries. """
+
+    entries = ''.join(ENTRY.format(i=i) for i in range(rows))
+
+    return FEED.format(rows=rows, entries=entries).encode()
+
+
+def parse_with_feedparser(content):
+    return len(feedparser.parse(content)['entries'])
+
+
+def parse_with_feeds(content):
+    chunks = (content[i:i + feeds.CHUNK_SIZE] for i in range(0, len(content), feeds.CHUNK_SIZE))
+    _, entries = feeds.parse_search_feed(chunks)
+
+    return sum(1 for _ in entries)
+
+
+def measure(parse, content, repeat):
+    """ Return the best wall time of `repeat` runs and the peak of traced memory of one run. """
+
+    timings = []
+
+    for _ in range(repeat):
+        start = time.perf_counter()
+        parse(content)
+        timings.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    parse(content)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return min(timings), peak
+
+
+if __name__ == '__main__':
+    for rows, repeat in [(100, 20), (10_000, 3)]:
+        content = generate_feed(rows)
+        print(f'{rows} rows ({len(content) / 1024 / 1024:.1f} MB):')
+
+        for name, parse in [('feedparser', parse_with_feedparser), ('feeds', parse_with_feeds)]:
+            seconds, peak = measure(parse, content, repeat)
+            print(f'    {name:<12}{seconds * 1000:>10.1f} ms{peak / 1024 / 1024:>10.1f} MB peak')
@@ -17,8 +17,17 @@ def get_authentication(eumetsat=False):
         An authentication object for a request; or
         None if couldn't get the authentication information.
 
+    Notes:
+        The authentication is resolved once per configuration snapshot.
+
      """
 
+    return config.get_derived(('authentication', eumetsat), lambda: read_authentication(eumetsat=eumetsat))
+
+
+def read_authentication(eumetsat=False):
+    """ Resolve the authentication from the sources set in the configuration. """
+
     conf = config.get_config()
     auth = conf.get('Authentication')
 
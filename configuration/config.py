@@ -1,25 +1,93 @@
 """ Handle the config file. """
 
+import types
 import datetime
+import threading
 import importlib.resources
 
 import yaml
+import shapely.ops
 import geopandas as gpd
 
 import configuration.paths as paths
 
 
+# The parsed configuration and the values derived from it, valid while the file's modification time is the same.
+_snapshot = {'mtime': None, 'config': None, 'derived': {}}
+_snapshot_lock = threading.RLock()
+
+
 def get_config():
-    """ Get the configuration dictionary from the configuration file. """
+    """ Get the configuration dictionary from the configuration file.
+
+     Notes:
+         The file is parsed only when its modification time changes, the same snapshot is returned otherwise.
+         The snapshot is shared by all callers and threads, so it is read-only: mappings can't be modified
+         and lists are turned into tuples.
+
+    """
+
+    mtime = paths.config.stat().st_mtime_ns
+
+    with _snapshot_lock:
+        if _snapshot['mtime'] != mtime:
+            with open(paths.config, 'r') as f:
+                config = yaml.full_load(f)
+
+            _snapshot.update(mtime=mtime, config=freeze(config), derived={})
+
+        return _snapshot['config']
+
+
+def freeze(value):
+    """ Make a read-only copy of a parsed YAML value. """
 
-    with open(paths.config, 'r') as f:
-        config = yaml.full_load(f)
+    if isinstance(value, dict):
+        return types.MappingProxyType({k: freeze(v) for k, v in value.items()})
 
-    return config
+    if isinstance(value, list):
+        return tuple(freeze(v) for v in value)
+
+    return value
+
+
+def get_derived(key, function):
+    """ Get a value derived from the configuration, computing it only once per configuration snapshot.
+
+     Args:
+         key: A hashable that identifies the value.
+         function (callable): Computes the value when it is not known yet.
+
+    """
+
+    with _snapshot_lock:
+        get_config()
+        derived = _snapshot['derived']
+
+        if key not in derived:
+            derived[key] = function()
+
+        return derived[key]
 
 
 def get_roi():
-    """ Get the ROI WKT string to use in a query. """
+    """ Get the ROI WKT string to use in a query.
+
+     Notes:
+         The ROI is read once per configuration snapshot.
+
+    """
+
+    return get_derived('roi', read_roi)
+
+
+def read_roi():
+    """ Read the ROI WKT string from the source set in the configuration.
+
+     Notes:
+         All features of the geopackage layer are merged into one (multi)polygon.
+
+    """
 
     params = get_config().get('Search').get('ROI')
 
@@ -33,7 +101,7 @@ def get_roi():
     if params.get('Geopackage') is not None:
         layer = params.get('Geopackage').get('Layer')
         gdf = gpd.read_file(paths.geopackage, layer=layer)
-        return gdf.loc[0, 'geometry'].wkt
+        return shapely.ops.unary_union(gdf.geometry).wkt
 
     raise ValueError
 
@@ -52,6 +120,37 @@ def get_dates():
     return start_date, end_date
 
 
+def get_hub_params(eumetsat=False):
+    """ Get the settings of a hub from the `Hubs` section of the configuration.
+
+     Args:
+         eumetsat (bool): Get the settings of EUMETSAT instead of Copernicus OA Hub.
+
+    Notes:
+         Configuration files generated before the `Hubs` section existed get an empty dictionary, so that the
+         callers fall back to their defaults.
+
+    """
+
+    hub = 'Copernicus Open Data Access' if eumetsat else 'Copernicus Open Access Hub'
+
+    return (get_config().get('Hubs') or {}).get(hub) or {}
+
+
+def get_hub_connections(eumetsat=False):
+    """ Get the maximum number of concurrent connections to open to a hub.
+
+     Args:
+         eumetsat (bool): Get the limit for EUMETSAT instead of Copernicus OA Hub.
+
+    Notes:
+         Configuration files generated before the `Hubs` section existed fall back to the defaults.
+
+    """
+
+    return get_hub_params(eumetsat=eumetsat).get('Connections', 2 if eumetsat else 4)
+
+
 def generate_template_config():
     """ Generate a template configuration file. """
 
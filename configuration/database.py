@@ -1,28 +1,283 @@
 """ Handle the database. """
 
+import re
 import sqlite3
+import datetime
 
 import configuration.paths as paths
 
+# columns of the original table
+ORIGINAL_COLUMNS = {
+    'product_id': 'TEXT PRIMARY KEY',
+    'title': 'TEXT UNIQUE',
+    'footprint_wkt': 'TEXT',
+    'file_size': 'INTEGER',
+    'eumetsat': 'BOOLEAN',
+    'status': 'TEXT',
+}
+
+# columns added to the original table, in the order they were introduced
+METADATA_COLUMNS = {
+    'platform': 'TEXT',
+    'product_type': 'TEXT',
+    'sensing_start': 'TEXT',
+    'sensing_end': 'TEXT',
+    'ingestion_date': 'TEXT',
+    'cloud_cover': 'REAL',
+    'download_state': 'TEXT',
+    'download_priority': 'INTEGER',
+    'checksum': 'TEXT',
+    'checksum_verified': 'BOOLEAN DEFAULT FALSE',
+    'local_path': 'TEXT',
+    'lta_requested_at': 'TEXT',
+    'quicklook_path': 'TEXT',
+    'fetched_at': 'TEXT',
+}
+
 
 def generate_metadata_database():
     """ Generate a new metadata database. """
 
     paths.database.unlink(missing_ok=True)
+    migrate_metadata_database()
+
+
+def migrate_metadata_database():
+    """ Upgrade the metadata database to the current schema in place, keeping the catalog.
+
+     Notes:
+         The schema version is stored in `PRAGMA user_version`, and every migration runs in its own transaction,
+         together with the version bump. A new database is created by running all of them.
+
+    """
+
+    with sqlite3.connect(paths.database) as connection:
+        cursor = connection.cursor()
+        cursor.execute('PRAGMA user_version;')
+        version = cursor.fetchone()[0]
+
+        for number, migration in enumerate(MIGRATIONS[version:], version + 1):
+            cursor.execute('BEGIN;')
+            migration(cursor)
+            cursor.execute(f'PRAGMA user_version = {number};')
+            connection.commit()
+
+
+def add_metadata_columns(cursor):
+    """ Create the tables, adding the columns and the footprint index that older databases are missing.
+
+     Notes:
+         Databases from before the migrations have some of the columns already, so every one is checked.
+
+    """
+
+    columns = ', '.join(f'{name} {type_}' for name, type_ in ORIGINAL_COLUMNS.items())
+    cursor.execute(f'CREATE TABLE IF NOT EXISTS metadata({columns});')
+
+    cursor.execute('PRAGMA table_info(metadata);')
+    existing = {row[1] for row in cursor.fetchall()}
+
+    for name, type_ in METADATA_COLUMNS.items():
+        if name not in existing:
+            cursor.execute(f'ALTER TABLE metadata ADD COLUMN {name} {type_};')
+
+    # bounding boxes of the footprints, filled in by `add_metadata_ids`
+    cursor.execute('CREATE VIRTUAL TABLE IF NOT EXISTS footprint_index USING rtree(id, min_x, max_x, min_y, max_y);')
+
+    cursor.execute(
+        'CREATE TABLE IF NOT EXISTS search_watermarks('
+        'query TEXT,'
+        'eumetsat BOOLEAN,'
+        'ingestion_date TEXT,'
+        'PRIMARY KEY (query, eumetsat)'
+        ');'
+    )
+
+
+def add_metadata_indexes(cursor):
+    """ Index the columns that the commands filter the catalog by, so they don't scan the whole table. """
+
+    # `sdm fetch metadata` and `sdm watch` select by status and hub
+    cursor.execute('CREATE INDEX IF NOT EXISTS metadata_status ON metadata(status, eumetsat);')
+    cursor.execute('CREATE INDEX IF NOT EXISTS metadata_eumetsat ON metadata(eumetsat);')
+    # the download queue, in the order of its priority
+    cursor.execute('CREATE INDEX IF NOT EXISTS metadata_download_state ON metadata(download_state, download_priority);')
+    # the product filters, see `find_products`
+    cursor.execute('CREATE INDEX IF NOT EXISTS metadata_sensing_start ON metadata(sensing_start);')
+    cursor.execute('CREATE INDEX IF NOT EXISTS metadata_ingestion_date ON metadata(ingestion_date);')
+    cursor.execute('CREATE INDEX IF NOT EXISTS metadata_platform ON metadata(platform, product_type);')
+
+
+def add_metadata_ids(cursor):
+    """ Give every product an explicit integer ID, the key of the footprint index.
+
+     Notes:
+         The index used to be keyed by rowids, which VACUUM can renumber in a table without an INTEGER PRIMARY KEY.
+         SQLite can't add a primary key to a table, so the table is copied with the rowids as the IDs. The ID
+         is the last column, so the other columns keep their positions.
 
-    with sqlite3.connect(paths.database) as con:
-        cur = con.cursor()
-
-        cur.execute(
-            'CREATE TABLE metadata('
-            'product_id TEXT PRIMARY KEY,'
-            'title TEXT UNIQUE,'
-            'footprint_wkt TEXT,'
-            'file_size INTEGER,'
-            'eumetsat BOOLEAN,'
-            'status TEXT'
-            ');'
+    """
+
+    cursor.execute('PRAGMA table_info(metadata);')
+    existing = [row[1] for row in cursor.fetchall()]
+
+    columns = {
+        **ORIGINAL_COLUMNS, 'product_id': 'TEXT NOT NULL UNIQUE', **METADATA_COLUMNS, 'id': 'INTEGER PRIMARY KEY'
+    }
+    definitions = ', '.join(f'{name} {type_}' for name, type_ in columns.items())
+    names = ', '.join(name for name in columns if name in existing)
+
+    cursor.execute(f'CREATE TABLE metadata_with_ids({definitions});')
+    cursor.execute(f'INSERT INTO metadata_with_ids({names}, id) SELECT {names}, rowid FROM metadata;')
+    cursor.execute('DROP TABLE metadata;')
+    cursor.execute('ALTER TABLE metadata_with_ids RENAME TO metadata;')
+
+    # the indexes were dropped with the old table
+    add_metadata_indexes(cursor)
+
+    cursor.execute('DELETE FROM footprint_index;')
+    cursor.execute('SELECT product_id FROM metadata WHERE footprint_wkt IS NOT NULL;')
+    index_footprints(cursor, [row[0] for row in cursor.fetchall()])
+
+
+# every migration upgrades the schema by one version, append new ones to the end
+MIGRATIONS = [
+    add_metadata_columns,
+    add_metadata_indexes,
+    add_metadata_ids,
+]
+
+
+def get_bounding_box(wkt):
+    """ Get the bounding box (min_x, max_x, min_y, max_y) of a WKT footprint without parsing the geometry. """
+
+    numbers = [float(n) for n in re.findall(r'[-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?', wkt)]
+    xs, ys = numbers[0::2], numbers[1::2]
+
+    return min(xs), max(xs), min(ys), max(ys)
+
+
+def index_footprints(cursor, ids):
+    """ Update the spatial index with the footprints of the products with the given IDs.
+
+     Notes:
+         Takes the cursor of the transaction that wrote the footprints, so both are committed together.
+
+    """
+
+    ids = list(ids)
+    rows = []
+
+    # stay well below the SQLite limit on the number of query parameters
+    for i in range(0, len(ids), 500):
+        chunk = ids[i:i + 500]
+        cursor.execute(
+            f'SELECT id, footprint_wkt FROM metadata WHERE product_id IN ({", ".join("?" * len(chunk))}) '
+            f'AND footprint_wkt IS NOT NULL;',
+            chunk
+        )
+        rows.extend(cursor.fetchall())
+
+    cursor.executemany(
+        'INSERT OR REPLACE INTO footprint_index(id, min_x, max_x, min_y, max_y) VALUES (?, ?, ?, ?, ?);',
+        [(id_, *get_bounding_box(wkt)) for id_, wkt in rows]
+    )
+
+
+def rebuild_footprint_index():
+    """ Index the footprints of all products from scratch, creating the index if the database predates it. """
+
+    with sqlite3.connect(paths.database) as connection:
+        cursor = connection.cursor()
+        cursor.execute(
+            'CREATE VIRTUAL TABLE IF NOT EXISTS footprint_index USING rtree(id, min_x, max_x, min_y, max_y);'
         )
+        cursor.execute('DELETE FROM footprint_index;')
+        cursor.execute('SELECT product_id FROM metadata WHERE footprint_wkt IS NOT NULL;')
+        index_footprints(cursor, [row[0] for row in cursor.fetchall()])
+
+
+def find_by_bounding_box(min_x, min_y, max_x, max_y):
+    """ Return the IDs of the products with footprints whose bounding boxes intersect the given one. """
+
+    with sqlite3.connect(paths.database) as connection:
+        cursor = connection.cursor()
+        cursor.execute(
+            'SELECT metadata.product_id FROM footprint_index JOIN metadata ON metadata.id = footprint_index.id '
+            'WHERE footprint_index.max_x >= ? AND footprint_index.min_x <= ? '
+            'AND footprint_index.max_y >= ? AND footprint_index.min_y <= ?;',
+            (min_x, max_x, min_y, max_y)
+        )
+        result = [row[0] for row in cursor.fetchall()]
+
+    return result
+
+
+def find_products(start_date=None, end_date=None, platforms=(), product_types=(), max_cloud_cover=None,
+                  statuses=(), min_size=None, max_size=None, bounding_box=None, order_by='sensing_start'):
+    """ Return the products that match all the given filters.
+
+    Args:
+        start_date (datetime.date): Sensed on this day or later.
+        end_date (datetime.date): Sensed on this day or earlier.
+        platforms (list of str): Any of these platforms, e.g. 'Sentinel-2'.
+        product_types (list of str): Any of these product types, e.g. 'S2MSI2A'.
+        max_cloud_cover (float): Cloud cover percentage of at most this.
+        statuses (list of str): Any of these statuses.
+        min_size (int): At least this many bytes.
+        max_size (int): At most this many bytes.
+        bounding_box (tuple): Footprint bounding box intersects this one (min_x, min_y, max_x, max_y).
+        order_by (str): The column to sort the products by.
+
+    Returns:
+        list of dict: The matching rows of the metadata table.
+
+    """
+
+    conditions, parameters = [], []
+
+    if start_date is not None:
+        conditions.append('sensing_start >= ?')
+        parameters.append(str(start_date))
+
+    if end_date is not None:
+        # sensing times are ISO strings, so everything on the end date sorts below the next day
+        conditions.append('sensing_start < ?')
+        parameters.append(str(end_date + datetime.timedelta(days=1)))
+
+    for column, values in [('platform', platforms), ('product_type', product_types), ('status', statuses)]:
+        if values:
+            conditions.append(f'{column} IN ({", ".join("?" * len(values))})')
+            parameters.extend(values)
+
+    if max_cloud_cover is not None:
+        conditions.append('cloud_cover <= ?')
+        parameters.append(max_cloud_cover)
+
+    if min_size is not None:
+        conditions.append('file_size >= ?')
+        parameters.append(min_size)
+
+    if max_size is not None:
+        conditions.append('file_size <= ?')
+        parameters.append(max_size)
+
+    if bounding_box is not None:
+        min_x, min_y, max_x, max_y = bounding_box
+        conditions.append(
+            'id IN (SELECT id FROM footprint_index WHERE max_x >= ? AND min_x <= ? AND max_y >= ? AND min_y <= ?)'
+        )
+        parameters.extend([min_x, max_x, min_y, max_y])
+
+    where = f'WHERE {" AND ".join(conditions)} ' if conditions else ''
+
+    with sqlite3.connect(paths.database) as connection:
+        connection.row_factory = sqlite3.Row
+        cursor = connection.cursor()
+        cursor.execute(f'SELECT * FROM metadata {where}ORDER BY {order_by};', parameters)
+        result = [dict(row) for row in cursor.fetchall()]
+
+    return result
 
 
 def get_entry_by_id(id_):
@@ -36,6 +291,18 @@ def get_entry_by_id(id_):
     return result
 
 
+def get_product(id_):
+    """ Return the entry with the specified product ID as a dictionary, or None if there is no such entry. """
+
+    with sqlite3.connect(paths.database) as connection:
+        connection.row_factory = sqlite3.Row
+        cursor = connection.cursor()
+        cursor.execute('SELECT * FROM metadata WHERE product_id = ?;', (id_,))
+        result = cursor.fetchone()
+
+    return None if result is None else dict(result)
+
+
 def get_entry_by_name(name):
     """ Return the entry with the specified product title. """
 
@@ -45,3 +312,29 @@ def get_entry_by_name(name):
         result = cursor.fetchone()
 
     return result
+
+
+def get_search_watermark(query, eumetsat=False):
+    """ Return the latest ingestion date seen in the results of the query, or None if it never ran in full. """
+
+    with sqlite3.connect(paths.database) as connection:
+        cursor = connection.cursor()
+        cursor.execute(
+            'SELECT ingestion_date FROM search_watermarks WHERE query = ? AND eumetsat = ?;',
+            (query, int(eumetsat))
+        )
+        result = cursor.fetchone()
+
+    return None if result is None else result[0]
+
+
+def update_search_watermark(query, ingestion_date, eumetsat=False):
+    """ Move the watermark of the query forward to the ingestion date, if it is later. """
+
+    with sqlite3.connect(paths.database) as connection:
+        cursor = connection.cursor()
+        cursor.execute(
+            'INSERT INTO search_watermarks(query, eumetsat, ingestion_date) VALUES (?, ?, ?) '
+            'ON CONFLICT(query, eumetsat) DO UPDATE SET ingestion_date = max(ingestion_date, excluded.ingestion_date);',
+            (query, int(eumetsat), ingestion_date)
+        )
@@ -29,3 +29,33 @@ class FailedRequestError(Exception):
     def __init__(self, request):
         super(FailedRequestError, self).__init__()
         self.request = request
+
+
+class MalformedFeedError(Exception):
+    """ Raised when a response body is not a well-formed feed, e.g. an HTML error page or a truncated body. """
+
+    def __init__(self, reason):
+        super(MalformedFeedError, self).__init__(reason)
+        self.reason = reason
+
+
+class CancelledDownloadError(Exception):
+    """ Raised inside a download to stop it, e.g. when the user interrupts a bulk download. """
+
+    def __init__(self):
+        super(CancelledDownloadError, self).__init__()
+
+
+class ChecksumMismatchError(Exception):
+    """ Raised when a downloaded file doesn't match its checksum. """
+
+    def __init__(self, filename):
+        super(ChecksumMismatchError, self).__init__()
+        self.filename = filename
+
+
+class RangeNotSupportedError(Exception):
+    """ Raised when a server answers a Range request with the whole file. """
+
+    def __init__(self):
+        super(RangeNotSupportedError, self).__init__()
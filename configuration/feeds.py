@@ -0,0 +1,199 @@
+""" Parse Open Search and OData Atom feeds incrementally. """
+
+import re
+import itertools
+import xml.etree.ElementTree as ElementTree
+
+import configuration.exceptions as exceptions
+
+ATOM = '{http://www.w3.org/2005/Atom}'
+OPENSEARCH = '{http://a9.com/-/spec/opensearch/1.1/}'
+ODATA = '{http://schemas.microsoft.com/ado/2007/08/dataservices}'
+ODATA_METADATA = '{http://schemas.microsoft.com/ado/2007/08/dataservices/metadata}'
+
+CHUNK_SIZE = 64 * 1024
+
+# Open Search entries store product properties as typed elements, e.g. <double name="cloudcoverpercentage">
+SEARCH_FIELDS = {
+    'footprint': 'footprint_wkt',
+    'size': 'file_size',
+    'platformname': 'platform',
+    'producttype': 'product_type',
+    'beginposition': 'sensing_start',
+    'endposition': 'sensing_end',
+    'ingestiondate': 'ingestion_date',
+    'cloudcoverpercentage': 'cloud_cover',
+    'online': 'status',
+}
+
+SIZE_UNITS = {'B': 1, 'KB': 1024, 'MB': 1024 ** 2, 'GB': 1024 ** 3, 'TB': 1024 ** 4}
+
+coordinates_regex = re.compile(r'<gml:coordinates>(.+)</gml:coordinates>')
+
+
+def iterparse(chunks):
+    """ Parse an Atom feed as its bytes arrive.
+
+    Args:
+        chunks (iterable of bytes): The body of the response, e.g. `request.iter_content(CHUNK_SIZE)`.
+
+    Notes:
+        The function works like a generator, yielding each child of the root element (or the root element itself
+        when the document is a single entry) as soon as it is complete. Yielded elements are discarded afterwards,
+        so the memory use does not grow with the size of the feed. A body that is not well-formed XML, including
+        one that ends early, raises MalformedFeedError.
+
+    """
+
+    parser = ElementTree.XMLPullParser(events=('start', 'end'))
+    root, depth = None, 0
+
+    for chunk in itertools.chain(chunks, [b'']):
+        try:
+            if chunk:
+                parser.feed(chunk)
+            else:
+                parser.close()
+
+            events = list(parser.read_events())
+        except ElementTree.ParseError as e:
+            raise exceptions.MalformedFeedError(str(e)) from e
+
+        for event, element in events:
+            if event == 'start':
+                root = element if root is None else root
+                depth += 1
+                continue
+
+            depth -= 1
+
+            if depth == 1 and root.tag != f'{ATOM}entry':
+                yield element
+                root.clear()
+            elif depth == 0 and element.tag == f'{ATOM}entry':
+                yield element
+
+
+def parse_search_feed(chunks):
+    """ Parse a page of Open Search results as its bytes arrive.
+
+    Returns:
+        total_results, entries: The total number of products that match the query and a generator
+        of the page entries, each a dictionary with values for columns of the database.
+
+    Notes:
+        The page is read up to the total number of results before returning; the entries
+        are parsed while iterating the generator.
+
+    """
+
+    elements = iterparse(chunks)
+    total_results = 0
+
+    for element in elements:
+        if element.tag == f'{OPENSEARCH}totalResults':
+            try:
+                total_results = int(element.text)
+            except (TypeError, ValueError) as e:
+                raise exceptions.MalformedFeedError(f'Invalid totalResults: {element.text!r}') from e
+
+            break
+
+        if element.tag == f'{ATOM}entry':
+            # no total in the header, put the entry back
+            elements = itertools.chain([element], elements)
+            break
+
+    entries = (parse_search_entry(element) for element in elements if element.tag == f'{ATOM}entry')
+
+    return total_results, entries
+
+
+def parse_search_entry(element):
+    """ Extract the values for columns of the database from an Open Search feed entry. """
+
+    entry = dict.fromkeys(SEARCH_FIELDS.values())
+    entry.update({
+        'product_id': element.findtext(f'{ATOM}id'),
+        'title': element.findtext(f'{ATOM}title'),
+        'status': 'found',
+    })
+
+    for field in element:
+        column = SEARCH_FIELDS.get(field.get('name'))
+
+        if column is not None:
+            entry[column] = field.text
+
+    if entry['file_size'] is not None:
+        entry['file_size'] = parse_size(entry['file_size'])
+
+    if entry['cloud_cover'] is not None:
+        entry['cloud_cover'] = float(entry['cloud_cover'])
+
+    # EUMETSAT has no offline products, so their feeds don't have the 'online' property.
+    if entry['status'] != 'found':
+        entry['status'] = 'online' if entry['status'] == 'true' else 'offline'
+
+    return entry
+
+
+def iter_odata_entries(chunks):
+    """ Parse an OData product entry, or a feed of them, as its bytes arrive.
+
+    Notes:
+        The function works like a generator, yielding a dictionary with values for columns of the database
+        for every product entry.
+
+    """
+
+    for element in iterparse(chunks):
+        if element.tag == f'{ATOM}entry':
+            yield parse_odata_entry(element)
+
+
+def parse_odata_entry(element):
+    """ Extract the values for columns of the database from an OData product entry. """
+
+    properties = element.find(f'{ODATA_METADATA}properties')
+
+    def get(*names):
+        return properties.findtext('/'.join(f'{ODATA}{name}' for name in names))
+
+    extracted_coordinates = coordinates_regex.findall(get('ContentGeometry'))[0]
+    extracted_coordinates = extracted_coordinates.split(' ')
+    extracted_coordinates = ','.join([' '.join(s.split(',')[::-1]) for s in extracted_coordinates])
+
+    # EUMETSAT has no offline products, so their feeds don't have the 'Online' property.
+    online = get('Online') or 'true'
+
+    checksum = get('Checksum', 'Value') if get('Checksum', 'Algorithm') == 'MD5' else None
+
+    return {
+        'product_id': get('Id'),
+        'title': get('Name'),
+        'footprint_wkt': f'Polygon(({extracted_coordinates}))',
+        'file_size': int(get('ContentLength')),
+        'status': 'online' if online == 'true' else 'offline',
+        'sensing_start': parse_odata_date(get('ContentDate', 'Start')),
+        'sensing_end': parse_odata_date(get('ContentDate', 'End')),
+        'ingestion_date': parse_odata_date(get('IngestionDate')),
+        'checksum': checksum.lower() if checksum else None,
+    }
+
+
+def parse_odata_date(date):
+    """ Mark OData dates as UTC the way Open Search does, so that the two can be compared as strings. """
+
+    if not date or date.endswith('Z'):
+        return date or None
+
+    return f'{date}Z'
+
+
+def parse_size(size):
+    """ Convert a human-readable size like '1.05 GB' to the approximate number of bytes. """
+
+    value, unit = size.split()
+
+    return round(float(value) * SIZE_UNITS[unit.upper()])
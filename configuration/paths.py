@@ -7,6 +7,8 @@ name = working_directory.name.replace(' ', '_')
 
 config = pathlib.Path('sdm-config.yaml')
 database = pathlib.Path(f'sdm-metadata.sqlite3')
+search_cache = pathlib.Path('sdm-search-cache.sqlite3')
+telemetry_log = pathlib.Path('sdm-telemetry.jsonl')
 geopackage = working_directory / 'Data' / f'{name}-sdm.gpkg'
 template_config = pathlib.Path('configuration/sdm-config-template.yaml')
 
@@ -0,0 +1,154 @@
+""" Keep one pooled HTTP session per hub, so that requests reuse connections and retry transient failures. """
+
+import random
+
+import requests
+import requests.adapters
+import urllib3.util.retry
+
+import configuration.config as config
+import configuration.telemetry as telemetry
+import configuration.exceptions as exceptions
+import configuration.authentication as authentication
+
+DEFAULT_POOL_SIZE = 8
+DEFAULT_CONNECT_TIMEOUT = 10  # s
+DEFAULT_READ_TIMEOUT = 120  # s, between bytes, not for the whole response
+DEFAULT_RETRIES = 5
+DEFAULT_BACKOFF = 0.5  # s, doubled with every retry
+DEFAULT_SEGMENTS = 1  # connections per download, one disables segmented downloads
+DEFAULT_MAX_SEGMENTS = 2  # the hubs limit concurrent downloads per user
+DEFAULT_DOWNLOADS = 1  # products downloaded at once by bulk downloads
+
+# the hubs answer with these when they are overloaded or rate limit the user
+RETRY_STATUSES = [429, 500, 502, 503, 504]
+
+
+class JitteredRetry(urllib3.util.retry.Retry):
+    """ A retry policy that waits up to `jitter` more seconds on every backoff, at random.
+
+     Notes:
+         Clients throttled at the same time would otherwise retry at the same time. `backoff_jitter` does the same
+         in urllib3 2, but not in urllib3 1.26.
+
+    """
+
+    def __init__(self, *args, jitter=0, **kwargs):
+        super(JitteredRetry, self).__init__(*args, **kwargs)
+        self.jitter = jitter
+
+    def new(self, **kwargs):
+        # every retry creates the next policy, which has to keep the jitter
+        retry = super(JitteredRetry, self).new(**kwargs)
+        retry.jitter = self.jitter
+
+        return retry
+
+    def get_backoff_time(self):
+        backoff = super(JitteredRetry, self).get_backoff_time()
+
+        return backoff + random.uniform(0, self.jitter) if backoff > 0 else backoff
+
+
+def get_settings(eumetsat=False):
+    """ Get the pool size, the timeouts, and the retry policy of a hub from the configuration.
+
+     Returns:
+         dict: 'pool size', 'timeout' (connect, read), 'retries', 'backoff', 'segments' (connections per download),
+         'max segments' (the cap for 'segments'), and 'downloads' (products downloaded at once).
+
+    Notes:
+         All connections of all downloads together stay within 'max segments'. Configuration files generated
+         before these settings existed fall back to the defaults.
+
+    """
+
+    params = config.get_hub_params(eumetsat=eumetsat)
+    max_segments = params.get('Max segments', DEFAULT_MAX_SEGMENTS)
+
+    return {
+        'pool size': max(params.get('Pool size', DEFAULT_POOL_SIZE), config.get_hub_connections(eumetsat=eumetsat)),
+        'timeout': (
+            params.get('Connect timeout', DEFAULT_CONNECT_TIMEOUT),
+            params.get('Read timeout', DEFAULT_READ_TIMEOUT),
+        ),
+        'retries': params.get('Retries', DEFAULT_RETRIES),
+        'backoff': params.get('Backoff', DEFAULT_BACKOFF),
+        'segments': min(params.get('Download segments', DEFAULT_SEGMENTS), max_segments),
+        'max segments': max_segments,
+        'downloads': max(min(params.get('Concurrent downloads', DEFAULT_DOWNLOADS), max_segments), 1),
+    }
+
+
+def get_session(eumetsat=False):
+    """ Get the session to send requests to a hub with.
+
+     Args:
+         eumetsat (bool): Get the session for EUMETSAT instead of Copernicus OA Hub.
+
+    Notes:
+         The session is shared by all threads and created once per configuration snapshot.
+
+    """
+
+    auth = authentication.get_authentication(eumetsat=eumetsat)
+
+    if auth is None:
+        raise exceptions.NoAuthenticationFoundError()
+
+    return config.get_derived(
+        ('session', eumetsat), lambda: create_session(auth, get_settings(eumetsat=eumetsat), eumetsat=eumetsat)
+    )
+
+
+def create_session(auth, settings, eumetsat=False):
+    """ Create a session with a connection pool and a retry policy.
+
+     Notes:
+         Requests are retried on connection errors and on RETRY_STATUSES, waiting `backoff * 2 ** retry` seconds
+         plus up to `backoff` seconds of random jitter, or as long as the Retry-After header asks. After the last
+         retry the response is returned as it is, so callers see the status code. Every response is recorded
+         by the telemetry.
+
+    """
+
+    retry = JitteredRetry(
+        total=settings['retries'],
+        status_forcelist=RETRY_STATUSES,
+        allowed_methods=['GET', 'HEAD'],
+        backoff_factor=settings['backoff'],
+        jitter=settings['backoff'],
+        raise_on_status=False,
+    )
+    adapter = requests.adapters.HTTPAdapter(pool_maxsize=settings['pool size'], max_retries=retry)
+
+    session = requests.Session()
+    session.auth = auth
+    session.hooks['response'].append(lambda response, **kwargs: telemetry.record_response(response, eumetsat))
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+
+    return session
+
+
+def get(url, eumetsat=False, **kwargs):
+    """ Send a GET request to a hub through its session.
+
+     Args:
+         url (str): The URL to get.
+         eumetsat (bool): The URL belongs to EUMETSAT instead of Copernicus OA Hub.
+         **kwargs: Passed on to `requests.Session.get`.
+
+    Returns:
+        requests.Response: The response, use it as a context manager when streaming.
+
+    """
+
+    kwargs.setdefault('timeout', get_settings(eumetsat=eumetsat)['timeout'])
+    session = get_session(eumetsat=eumetsat)
+
+    try:
+        return session.get(url, **kwargs)
+    except requests.RequestException as e:
+        telemetry.record_request_error(url, e, eumetsat=eumetsat)
+        raise
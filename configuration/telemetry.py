@@ -0,0 +1,201 @@
+""" Record how the hubs perform: every request and every download, as JSON lines and Prometheus metrics.
+
+The JSON-lines log keeps every event with its time, so it can be analysed by hub and time of day. The Prometheus
+textfile (for the node exporter's textfile collector) has the totals of the running process and is rewritten
+after every download and when the process exits.
+
+"""
+
+import json
+import time
+import atexit
+import pathlib
+import datetime
+import threading
+import collections
+import urllib.parse
+
+import configuration.paths as paths
+import configuration.config as config
+
+_lock = threading.Lock()
+_metrics = collections.defaultdict(float)
+_exit_handler = {'registered': False}
+
+
+def get_settings():
+    """ Get the JSON-lines log file and the Prometheus textfile from the configuration, None if disabled.
+
+     Notes:
+         Configuration files generated before the `Telemetry` section existed log to the default file.
+
+    """
+
+    params = config.get_config().get('Telemetry') or {}
+
+    log = params.get('Log', str(paths.telemetry_log))
+    textfile = params.get('Prometheus textfile')
+
+    return (None if log in [None, 'none'] else log), (None if textfile in [None, 'none'] else textfile)
+
+
+def get_hub(eumetsat=False):
+    """ Get the label of a hub. """
+
+    return 'coda' if eumetsat else 'scihub'
+
+
+def record_response(response, eumetsat=False):
+    """ Record a response: the status code, the time until the headers arrived, and the number of retries.
+
+     Notes:
+         Use it as a response hook of a session, see `sessions.create_session`.
+
+    """
+
+    hub = get_hub(eumetsat)
+    retries = response.raw.retries if response.raw is not None else None
+    retry_count = len(retries.history) if retries is not None else 0
+    latency = response.elapsed.total_seconds()
+
+    with _lock:
+        _metrics['sdm_http_requests_total', hub, str(response.status_code)] += 1
+        _metrics['sdm_http_request_latency_seconds_sum', hub, None] += latency
+        _metrics['sdm_http_request_latency_seconds_count', hub, None] += 1
+        _metrics['sdm_http_retries_total', hub, None] += retry_count
+
+    write_event({
+        'event': 'request',
+        'hub': hub,
+        'url': strip_query(response.url),
+        'status': response.status_code,
+        'latency': round(latency, 4),
+        'retries': retry_count,
+    })
+
+
+def record_request_error(url, error, eumetsat=False):
+    """ Record a request that got no response at all, e.g. after the connection failed on every retry. """
+
+    hub = get_hub(eumetsat)
+
+    with _lock:
+        _metrics['sdm_http_requests_total', hub, 'error'] += 1
+
+    write_event({'event': 'request', 'hub': hub, 'url': strip_query(url), 'error': type(error).__name__})
+
+
+def start_download(file, eumetsat=False):
+    """ Start measuring a download.
+
+     Returns:
+         measurement, on_chunk: Pass the measurement to `finish_download`, call `on_chunk` with every chunk of data
+         as it arrives, from any thread.
+
+    """
+
+    measurement = {
+        'file': str(file),
+        'hub': get_hub(eumetsat),
+        'start': time.monotonic(),
+        'first byte': None,
+        'bytes': 0,
+        'lock': threading.Lock(),
+    }
+
+    def on_chunk(chunk):
+        with measurement['lock']:
+            if measurement['first byte'] is None:
+                measurement['first byte'] = time.monotonic()
+
+            measurement['bytes'] += len(chunk)
+
+    return measurement, on_chunk
+
+
+def finish_download(measurement, outcome, **details):
+    """ Record a download: the bytes received, the throughput, and the outcome.
+
+     Args:
+         measurement (dict): From `start_download`.
+         outcome (str): E.g. 'complete', 'incomplete', or the name of the error that stopped the download.
+         **details: Added to the JSON-lines event, e.g. the number of segments.
+
+    """
+
+    seconds = time.monotonic() - measurement['start']
+    first_byte = measurement['first byte']
+    hub = measurement['hub']
+
+    with _lock:
+        _metrics['sdm_downloads_total', hub, outcome] += 1
+        _metrics['sdm_download_bytes_total', hub, None] += measurement['bytes']
+        _metrics['sdm_download_duration_seconds_sum', hub, None] += seconds
+
+    write_event({
+        'event': 'download',
+        'hub': hub,
+        'file': measurement['file'],
+        'outcome': outcome,
+        'bytes': measurement['bytes'],
+        'seconds': round(seconds, 3),
+        'throughput': round(measurement['bytes'] / seconds) if seconds > 0 else None,
+        'time_to_first_byte': round(first_byte - measurement['start'], 4) if first_byte is not None else None,
+        **details,
+    })
+    write_textfile()
+
+
+def write_event(event):
+    """ Append an event to the JSON-lines log. """
+
+    log, textfile = get_settings()
+
+    if textfile is not None and not _exit_handler['registered']:
+        _exit_handler['registered'] = True
+        atexit.register(write_textfile)
+
+    if log is None:
+        return
+
+    line = json.dumps({'time': datetime.datetime.now(datetime.timezone.utc).isoformat(), **event})
+
+    with _lock:
+        with open(log, 'a') as f:
+            f.write(line + '\n')
+
+
+def write_textfile():
+    """ Write the metrics of the process to the Prometheus textfile, replacing it atomically. """
+
+    _, textfile = get_settings()
+
+    if textfile is None:
+        return
+
+    lines = []
+
+    with _lock:
+        for (name, hub, label), value in sorted(_metrics.items(), key=lambda item: tuple(map(str, item[0]))):
+            labels = f'hub="{hub}"'
+
+            if label is not None:
+                labels += f',{"code" if name == "sdm_http_requests_total" else "outcome"}="{label}"'
+
+            lines.append(f'{name}{{{labels}}} {value:.15g}')
+
+    lines.append(f'sdm_last_update_timestamp_seconds {time.time():.0f}')
+
+    temporary_file = f'{textfile}.tmp'
+
+    with open(temporary_file, 'w') as f:
+        f.write('\n'.join(lines) + '\n')
+
+    # the textfile collector must never see a half-written file
+    pathlib.Path(temporary_file).replace(textfile)
+
+
+def strip_query(url):
+    """ Drop the query string from a URL, search queries make the log hard to read. """
+
+    return urllib.parse.urlsplit(url)._replace(query='').geturl()
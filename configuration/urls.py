@@ -25,6 +25,20 @@ def get_product_url(id_, eumetsat=False):
     return url
 
 
+def get_products_url(eumetsat=False):
+    """ Get the URL of the OData products collection.
+
+     Notes:
+         Add `$filter`, `$top`, and `$skip` parameters to select products from the collection.
+
+    """
+
+    base_url = 'https://coda.eumetsat.int/odata/v1/' if eumetsat else 'https://scihub.copernicus.eu/dhus/odata/v1/'
+    url = base_url + 'Products'
+
+    return url
+
+
 def get_quicklook_url(eumetsat=False):
     """ Get the generic URL for quicklooks.
 
@@ -1,6 +1,8 @@
 """ This package contains code for fetching Sentinel products and metadata. """
 
 from fetching.product import product
+from fetching.products import products
 from fetching.metadata import metadata
+from fetching.quicklooks import quicklooks
 
 from fetching.fetch import fetch
@@ -0,0 +1,48 @@
+""" Limit the total bandwidth of concurrent downloads. """
+
+import time
+import threading
+
+import configuration.config as config
+
+
+def get_bandwidth():
+    """ Get the bandwidth limit for all downloads together in bytes per second, 0 for no limit. """
+
+    params = config.get_config().get('Downloads') or {}
+
+    return int((params.get('Bandwidth MB/s') or 0) * 1024 * 1024)
+
+
+def get_limiter(bandwidth):
+    """ Get a function that keeps the data passed to it by all threads within the bandwidth.
+
+    Args:
+        bandwidth (int): Bytes per second, 0 for no limit.
+
+    Returns:
+        callable: Takes a chunk of data that was just received and blocks as long as the bandwidth requires.
+
+    Notes:
+        The limiter is a token bucket that holds up to a second worth of data. Every chunk takes its size from the
+        bucket, possibly going into debt, and the thread then sleeps until the debt would be paid off.
+
+    """
+
+    if not bandwidth:
+        return lambda chunk: None
+
+    lock = threading.Lock()
+    bucket = {'tokens': bandwidth, 'time': time.monotonic()}
+
+    def limit(chunk):
+        with lock:
+            now = time.monotonic()
+            bucket['tokens'] = min(bandwidth, bucket['tokens'] + (now - bucket['time']) * bandwidth) - len(chunk)
+            bucket['time'] = now
+            wait = -bucket['tokens'] / bandwidth
+
+        if wait > 0:
+            time.sleep(wait)
+
+    return limit
@@ -0,0 +1,156 @@
+""" Download many products at once, the way `sdm fetch products` and `sdm watch` do. """
+
+import time
+import threading
+import concurrent.futures
+
+import click
+import urllib3
+import requests
+
+import meta.filters as filters
+import fetching.queue as queue
+import fetching.store as store
+import fetching.data_api as data_api
+import configuration.urls as urls
+import configuration.paths as paths
+import configuration.sessions as sessions
+import configuration.exceptions as exceptions
+
+
+def queue_products(options, default_statuses):
+    """ Queue the products that match the filter options and are not downloaded yet.
+
+     Args:
+         options (dict): The filter options, see `filters.product_filters`.
+         default_statuses (tuple of str): The statuses to queue if the options don't name any.
+
+    """
+
+    options = dict(options, status=options['status'] or default_statuses)
+    matching = [product for product in filters.select_products(**options) if not is_downloaded(product)]
+    queue.enqueue([product['product_id'] for product in matching])
+
+
+def download_products(products_to_fetch, limit):
+    """ Download the queued products, every hub with its own number of concurrent downloads.
+
+    Args:
+        products_to_fetch (list of dict): The rows of the metadata table, in the order of the queue.
+        limit (callable): The bandwidth limiter, see `bandwidth.get_limiter`.
+
+    Returns:
+        done, failed: The number of downloaded and failed products. The others stay queued.
+
+    Notes:
+        The download state of every product is recorded as soon as it is known, so an interrupted run can be
+        resumed. On Ctrl+C the running downloads stop after their current chunk.
+
+    """
+
+    hubs = {bool(product['eumetsat']) for product in products_to_fetch}
+    settings = {hub: sessions.get_settings(eumetsat=hub) for hub in hubs}
+    executors = {
+        hub: concurrent.futures.ThreadPoolExecutor(max_workers=settings[hub]['downloads'])
+        for hub in hubs
+    }
+    # all connections of the concurrent downloads together stay within the hub's limit
+    segment_counts = {
+        hub: max(min(settings[hub]['segments'], settings[hub]['max segments'] // settings[hub]['downloads']), 1)
+        for hub in hubs
+    }
+
+    stop = threading.Event()
+    received = [0]
+
+    def on_chunk(chunk):
+        if stop.is_set():
+            raise exceptions.CancelledDownloadError()
+
+        limit(chunk)
+        received[0] += len(chunk)
+
+    pending = {}
+
+    for product in products_to_fetch:
+        hub = bool(product['eumetsat'])
+        future = executors[hub].submit(download_product, product, segment_counts[hub], on_chunk)
+        pending[future] = product
+
+    done, failed = 0, 0
+    start_time = time.time()
+
+    try:
+        while pending:
+            finished, _ = concurrent.futures.wait(pending, timeout=0.5)
+
+            for future in finished:
+                product = pending.pop(future)
+
+                try:
+                    complete = future.result()
+                except (
+                    exceptions.FailedRequestError,
+                    exceptions.ChecksumMismatchError,
+                    requests.RequestException,
+                    urllib3.exceptions.HTTPError,
+                ):
+                    queue.set_download_state(product['product_id'], queue.FAILED)
+                    failed += 1
+                    continue
+
+                # incomplete downloads stay queued and resume from their `.part` files next time
+                if complete:
+                    product_file = get_product_file(product)
+                    data_api.save_product_file(product['product_id'], product_file, product['checksum'] is not None)
+                    store.add_to_store(product['product_id'], product_file, product['checksum'])
+                    queue.set_download_state(product['product_id'], queue.DONE)
+                    done += 1
+
+            speed = received[0] / 1024 / 1024 / max(time.time() - start_time, 1e-3)
+            processed = len(products_to_fetch) - len(pending)
+
+            # carriage return, clear line
+            click.echo(f'\r\033[0J⏳ Downloading products [{processed}/{len(products_to_fetch)}]', nl=False)
+            click.echo(f' {speed:.1f} MB/s', nl=False)
+    finally:
+        stop.set()
+
+        for executor in executors.values():
+            executor.shutdown(cancel_futures=True)
+
+    return done, failed
+
+
+def download_product(product, segment_count, on_chunk):
+    """ Download a queued product to the raw file storage.
+
+     Returns:
+         bool: True if the product is complete.
+
+    """
+
+    if is_downloaded(product):
+        return True
+
+    url = urls.get_product_url(product['product_id'], eumetsat=bool(product['eumetsat'])) + '$value'
+
+    return data_api.download_product_file(
+        url, get_product_file(product), product['file_size'], product['checksum'], bool(product['eumetsat']),
+        segment_count, on_chunk
+    )
+
+
+def get_product_file(product):
+    """ Get the file of a product in the raw file storage. """
+
+    return paths.raw_file_storage / f'{product["title"]}.zip'
+
+
+def is_downloaded(product):
+    """ Check if the intact product file is in the raw file storage, see `data_api.check_product_file`. """
+
+    return data_api.check_product_file(
+        product['product_id'], get_product_file(product), product['file_size'], product['checksum'],
+        bool(product['checksum_verified'])
+    )
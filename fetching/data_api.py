@@ -1,19 +1,32 @@
 """ Manage the Copernicus / EUMETSAT OData API. """
 
-import re
 import time
-import shutil
-import pathlib
+import hashlib
 import sqlite3
+import datetime
+import concurrent.futures
 
 import click
+import urllib3
 import requests
-import feedparser
 
+import fetching.store as store
+import fetching.segments as segments
 import configuration.urls as urls
+import configuration.feeds as feeds
 import configuration.paths as paths
+import configuration.sessions as sessions
+import configuration.telemetry as telemetry
+import configuration.config as config
+import configuration.database as database
 import configuration.exceptions as exceptions
-import configuration.authentication as authentication
+
+
+# Metadata is written in batches, so one transaction covers many products.
+METADATA_BATCH_SIZE = 100
+
+# Products requested at once from the OData collection, keeps the filter URL within common length limits.
+METADATA_REQUEST_SIZE = 50
 
 
 def fetch_metadata_by_id(id_, eumetsat=False):
@@ -24,52 +37,145 @@ def fetch_metadata_by_id(id_, eumetsat=False):
         eumetsat (bool): Use Eumetsat instead of Copernicus OA Hub (for Sentinel-3 ocean data).
 
     Returns:
-       id_, title, wkt, file_size, eumetsat, status: values for columns of the database.
+       id_, title, wkt, file_size, eumetsat, status, checksum: values for columns of the database.
 
     Notes:
         The function does not check if the metadata is already in the database by design.
 
     """
 
-    auth = authentication.get_authentication(eumetsat=eumetsat)
+    entry = request_metadata(id_, eumetsat=eumetsat)
+    save_metadata_entries([entry])
+
+    return id_, entry['title'], entry['footprint_wkt'], entry['file_size'], eumetsat, entry['status'], entry['checksum']
+
+
+def find_downloaded_product(id_):
+    """ Find a downloaded product in the database, if its metadata is fresh enough to skip asking the hub.
+
+    Returns:
+       id_, title, wkt, file_size, eumetsat, status, checksum: values for columns of the database, like
+       `fetch_metadata_by_id`, or None if the metadata is stale or the product file is not there and verified.
+
+    Notes:
+        See `Freshness hours` in the `Metadata` section of the configuration.
+
+    """
+
+    product = database.get_product(id_)
+
+    if product is None or not product['checksum_verified'] or product['fetched_at'] is None:
+        return None
+
+    fetched_at = datetime.datetime.fromisoformat(product['fetched_at'])
+
+    if datetime.datetime.now(datetime.timezone.utc) - fetched_at > get_freshness():
+        return None
+
+    product_file = paths.raw_file_storage / f'{product["title"]}.zip'
+
+    if not check_product_file(id_, product_file, product['file_size'], product['checksum'], verified=True):
+        return None
+
+    return (
+        id_, product['title'], product['footprint_wkt'], product['file_size'], bool(product['eumetsat']),
+        product['status'], product['checksum']
+    )
+
+
+def get_freshness():
+    """ Get for how long the metadata of a downloaded product is trusted without asking the hub again. """
 
-    if auth is None:
-        raise exceptions.NoAuthenticationFoundError()
+    params = config.get_config().get('Metadata') or {}
 
-    query = 'INSERT INTO metadata(product_id, title, footprint_wkt, file_size, eumetsat, status) VALUES ' \
-            '(?, ?, ?, ?, ?, ?) ON CONFLICT(product_id) DO UPDATE SET footprint_wkt = ?, file_size = ?, status = ?;'
+    return datetime.timedelta(hours=params.get('Freshness hours', 24) or 0)
 
-    coordinates_regex = re.compile(r'<gml:coordinates>(.+)</gml:coordinates>')
+
+def request_metadata(id_, eumetsat=False):
+    """ Request metadata for the product with the given ID from the hub.
+
+    Returns:
+        dict: The OData entry (see `feeds.parse_odata_entry`), with the product ID and the hub.
+
+    """
 
     url = urls.get_product_url(id_, eumetsat=eumetsat)
-    request = requests.get(url, auth=auth)
 
-    if request.status_code != 200:
-        raise exceptions.FailedRequestError(request)
+    with sessions.get(url, eumetsat=eumetsat, stream=True) as request:
+        if request.status_code != 200:
+            raise exceptions.FailedRequestError(request)
+
+        entry = next(feeds.iter_odata_entries(request.iter_content(feeds.CHUNK_SIZE)))
+
+    entry['product_id'] = id_
+    entry['eumetsat'] = eumetsat
+
+    return entry
+
+
+def request_metadata_batch(ids, eumetsat=False):
+    """ Request metadata for many products at once from the hub's OData collection.
+
+    Returns:
+        list of dict: The OData entries (see `feeds.parse_odata_entry`) with the hub. Products the hub
+        did not return are missing from the list.
+
+    """
+
+    params = {
+        '$filter': ' or '.join(f"Id eq '{id_}'" for id_ in ids),
+        '$top': len(ids),
+    }
+
+    url = urls.get_products_url(eumetsat=eumetsat)
+
+    with sessions.get(url, eumetsat=eumetsat, params=params, stream=True) as request:
+        if request.status_code != 200:
+            raise exceptions.FailedRequestError(request)
+
+        entries = list(feeds.iter_odata_entries(request.iter_content(feeds.CHUNK_SIZE)))
+
+    requested = set(ids)
+    entries = [entry for entry in entries if entry['product_id'] in requested]
+
+    for entry in entries:
+        entry['eumetsat'] = eumetsat
 
-    entry = feedparser.parse(request.content)['entries'][0]
+    return entries
 
-    title = entry['d_name']
 
-    extracted_coordinates = coordinates_regex.findall(entry['d_contentgeometry'])[0]
-    extracted_coordinates = extracted_coordinates.split(' ')
-    extracted_coordinates = ','.join([' '.join(s.split(',')[::-1]) for s in extracted_coordinates])
+def save_metadata_entries(entries):
+    """ Write the metadata of many products to the database in one transaction. """
 
-    wkt = f'Polygon(({extracted_coordinates}))'
-    file_size = int(entry['d_contentlength'])
+    # a verification holds only for the checksum it was made with, and requested products stay requested
+    # until they come online
+    query = 'INSERT INTO metadata(product_id, title, footprint_wkt, file_size, eumetsat, status, sensing_start, ' \
+            'sensing_end, ingestion_date, checksum, fetched_at) VALUES (:product_id, :title, :footprint_wkt, ' \
+            ':file_size, :eumetsat, :status, :sensing_start, :sensing_end, :ingestion_date, :checksum, ' \
+            ':fetched_at) ' \
+            'ON CONFLICT(product_id) DO UPDATE SET ' \
+            'footprint_wkt = excluded.footprint_wkt, file_size = excluded.file_size, ' \
+            'status = CASE WHEN status = "requested" AND excluded.status = "offline" THEN status ' \
+            'ELSE excluded.status END, ' \
+            'sensing_start = excluded.sensing_start, sensing_end = excluded.sensing_end, ' \
+            'ingestion_date = excluded.ingestion_date, checksum = excluded.checksum, ' \
+            'checksum_verified = checksum_verified AND checksum IS excluded.checksum, ' \
+            'fetched_at = excluded.fetched_at;'
 
-    # EUMETSAT has no offline products, so their feeds don't have the 'd_online' property.
-    status = 'online' if entry.get('d_online', 'true') == 'true' else 'offline'
+    if not entries:
+        return
+
+    fetched_at = datetime.datetime.now(datetime.timezone.utc).isoformat()
+    entries = [dict(entry, fetched_at=fetched_at) for entry in entries]
 
     with sqlite3.connect(paths.database) as connection:
         cursor = connection.cursor()
-        cursor.execute(query, (id_, title, wkt, file_size, eumetsat, status, wkt, file_size, status))
-
-    return id_, title, wkt, file_size, eumetsat, status
+        cursor.executemany(query, entries)
+        database.index_footprints(cursor, [entry['product_id'] for entry in entries])
 
 
 def fetch_metadata_by_ids(ids, eumetsat=False):
-    """ Fetch metadata for the product with the given ID.
+    """ Fetch metadata for the products with the given IDs.
 
     Args:
         ids (list of str): List of IDs to fetch metadata for.
@@ -79,27 +185,349 @@ def fetch_metadata_by_ids(ids, eumetsat=False):
         The function works like a generator, yielding the number of processed products.
         That is a way to keep progress when fetching multiple results.
 
+        The products are requested from the OData collection METADATA_REQUEST_SIZE at a time. Products missing
+        from a batch, and all products of a batch the hub refused, are requested one by one. The requests run
+        concurrently, limited by the hub's `Connections` setting. Only the calling thread writes to
+        the database, in batches of METADATA_BATCH_SIZE products. The products fetched before a failed
+        request are saved.
+
+    """
+
+    executor = concurrent.futures.ThreadPoolExecutor(max_workers=config.get_hub_connections(eumetsat=eumetsat))
+    pending = {}
+
+    for i in range(0, len(ids), METADATA_REQUEST_SIZE):
+        chunk = ids[i:i + METADATA_REQUEST_SIZE]
+        pending[executor.submit(request_metadata_batch, chunk, eumetsat)] = chunk, True
+
+    batch, processed = [], 0
+
+    try:
+        while pending:
+            done, _ = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+
+            for future in done:
+                requested, batched = pending.pop(future)
+
+                if batched:
+                    try:
+                        entries = future.result()
+                    except exceptions.FailedRequestError:
+                        # hubs that refuse collection filters get the products of the batch one by one
+                        entries = []
+
+                    returned = {entry['product_id'] for entry in entries}
+
+                    for id_ in requested:
+                        if id_ not in returned:
+                            pending[executor.submit(request_metadata, id_, eumetsat)] = [id_], False
+                else:
+                    entries = [future.result()]
+
+                batch.extend(entries)
+                processed += len(entries)
+
+                if len(batch) >= METADATA_BATCH_SIZE:
+                    save_metadata_entries(batch)
+                    batch = []
+
+                yield processed
+    finally:
+        executor.shutdown(cancel_futures=True)
+        save_metadata_entries(batch)
+
+
+def get_part_file(file):
+    """ Get the file a download is written to until it is complete. """
+
+    return file.with_name(file.name + '.part')
+
+
+def download_to_part_file(url, part_file, file_size=None, eumetsat=False, segment_count=1, on_chunk=None):
+    """ Download a file to its `.part` file, resuming what is already there.
+
+    Args:
+        url (str): The URL to download.
+        part_file (pathlib.Path): The file to write to, see `get_part_file`.
+        file_size (int): The expected size of the file, if known.
+        eumetsat (bool): The URL belongs to EUMETSAT instead of Copernicus OA Hub.
+        segment_count (int): Download a new file over this many parallel connections, see `segments.download`.
+        on_chunk (callable): Called with every chunk of data after it is written, e.g. to limit the bandwidth.
+
+    Returns:
+        str: The MD5 digest of the whole `.part` file, or None for segmented downloads.
+
+    Notes:
+        The download continues from the end of the `.part` file with a Range request. If the hub sends the whole
+        file instead, the `.part` file is overwritten. A download interrupted by a connection error is resumed
+        the same way, up to the hub's `Retries` times.
+
+        An interrupted segmented download is always resumed in segments. A new one falls back to a single stream
+        if the hub doesn't support Range requests.
+
+        The digest is computed as the data arrives, only the part of the file that was already there when
+        the download resumes is read from disk. Segments arrive out of order, so they are not hashed.
+
     """
 
-    for i, id_ in enumerate(ids, 1):
-        fetch_metadata_by_id(id_, eumetsat=eumetsat)
-        yield i
+    if segments.get_state_file(part_file).exists() or (segment_count > 1 and file_size and not part_file.exists()):
+        try:
+            segments.download(url, part_file, file_size, segment_count, eumetsat=eumetsat, on_chunk=on_chunk)
+            return None
+        except exceptions.RangeNotSupportedError:
+            pass
 
+    retries = sessions.get_settings(eumetsat=eumetsat)['retries']
+    md5, hashed = hashlib.md5(), 0
 
-def write_request_content_to_file(request, file):
-    """ Stream the opened request to the specified file. """
+    for attempt in range(retries + 1):
+        offset = part_file.stat().st_size if part_file.exists() else 0
 
-    with open(file, 'bw') as f:
-        shutil.copyfileobj(request.raw, f)
+        if file_size is not None and offset >= file_size:
+            if offset == file_size:
+                return get_md5(part_file).hexdigest()
 
+            # a larger file can't be the beginning of this one
+            offset = 0
 
-def wait_for_download_thread(download_thread, file, target_size):
-    """ Display the progress bar while waiting for the download thread to finish. """
+        headers = {'Range': f'bytes={offset}-'} if offset else {}
+
+        try:
+            with sessions.get(url, eumetsat=eumetsat, headers=headers, stream=True) as request:
+                if request.status_code not in [200, 206]:
+                    raise exceptions.FailedRequestError(request)
+
+                # 206 Partial Content carries the rest of the file, 200 OK the whole of it
+                mode = 'ab' if request.status_code == 206 else 'wb'
+
+                if mode == 'wb':
+                    md5, hashed = hashlib.md5(), 0
+                elif hashed != offset:
+                    md5, hashed = get_md5(part_file), offset
+
+                with open(part_file, mode) as f:
+                    while chunk := request.raw.read(feeds.CHUNK_SIZE):
+                        f.write(chunk)
+                        md5.update(chunk)
+                        hashed += len(chunk)
+
+                        if on_chunk is not None:
+                            on_chunk(chunk)
+
+            return md5.hexdigest()
+        except (requests.ConnectionError, urllib3.exceptions.HTTPError):
+            if attempt == retries:
+                raise
+
+
+def complete_download(part_file, file, file_size=None, checksum=None, digest=None):
+    """ Give the `.part` file its final name if the download is complete and intact.
+
+    Args:
+        part_file (pathlib.Path): The downloaded file.
+        file (pathlib.Path): The final name of the file.
+        file_size (int): The expected size of the file, if known.
+        checksum (str): The expected MD5 digest of the file, if known.
+        digest (str): The MD5 digest computed during the download, the file is hashed if it is None.
+
+    Returns:
+        bool: True if the file is complete.
+
+    Notes:
+        The rename is atomic, so a file with the final name is never partial. A complete file that doesn't match
+        the checksum is deleted and ChecksumMismatchError is raised.
+
+    """
+
+    # segmented downloads are preallocated, only the state file knows if they are complete
+    if segments.get_state_file(part_file).exists():
+        return False
+
+    if file_size is not None and part_file.stat().st_size != file_size:
+        return False
+
+    if checksum is not None and (digest or get_md5(part_file).hexdigest()) != checksum:
+        part_file.unlink()
+        raise exceptions.ChecksumMismatchError(file)
+
+    part_file.replace(file)
+
+    return True
+
+
+def download_product_file(url, file, file_size=None, checksum=None, eumetsat=False, segment_count=1, on_chunk=None):
+    """ Download a product to its file, verifying the size and the MD5 checksum.
+
+    Args:
+        url (str): The URL to download.
+        file (pathlib.Path): The file to download to.
+        file_size (int): The expected size of the file, if known.
+        checksum (str): The expected MD5 digest of the file, if known.
+        eumetsat (bool): The URL belongs to EUMETSAT instead of Copernicus OA Hub.
+        segment_count (int): See `download_to_part_file`.
+        on_chunk (callable): See `download_to_part_file`.
+
+    Returns:
+        bool: True if the file is complete.
+
+    Notes:
+        A download that doesn't match the checksum is downloaded once more from the start. If it doesn't match
+        again, ChecksumMismatchError is raised. Every attempt is recorded by the telemetry.
+
+    """
+
+    part_file = get_part_file(file)
+
+    for attempt in range(2):
+        resumed_from = get_downloaded_size(part_file)
+        measurement, measure = telemetry.start_download(file, eumetsat=eumetsat)
+
+        def on_data(chunk):
+            measure(chunk)
+
+            if on_chunk is not None:
+                on_chunk(chunk)
+
+        try:
+            digest = download_to_part_file(url, part_file, file_size, eumetsat, segment_count, on_data)
+            complete = complete_download(part_file, file, file_size, checksum, digest)
+        except Exception as e:
+            telemetry.finish_download(
+                measurement, type(e).__name__, segments=segment_count, resumed_from=resumed_from
+            )
+
+            if isinstance(e, exceptions.ChecksumMismatchError) and attempt == 0:
+                continue
+
+            raise
+
+        telemetry.finish_download(
+            measurement, 'complete' if complete else 'incomplete', segments=segment_count, resumed_from=resumed_from
+        )
+
+        return complete
+
+
+def check_product_file(id_, file, file_size=None, checksum=None, verified=False):
+    """ Check if a downloaded product file is complete and intact.
+
+    Args:
+        id_ (str): The product ID.
+        file (pathlib.Path): The product file.
+        file_size (int): The expected size of the file, if known.
+        checksum (str): The expected MD5 digest of the file, if known.
+        verified (bool): The file was verified before, see `save_product_file`.
+
+    Returns:
+        bool: True if the file is there and intact.
+
+    Notes:
+        A file that was verified before is trusted as long as it has the right size, so multi-GB files
+        are not hashed again. Other files are hashed once and the result is recorded. A file that doesn't match
+        the checksum is deleted. A missing file is linked from the shared store if the store has it.
+
+    """
+
+    if not file.exists() and store.link_from_store(id_, file, file_size, checksum):
+        save_product_file(id_, file, verified=checksum is not None)
+        return True
+
+    if not file.exists() or (file_size is not None and file.stat().st_size != file_size):
+        return False
+
+    if verified or checksum is None:
+        return True
+
+    if get_md5(file).hexdigest() != checksum:
+        file.unlink()
+        return False
+
+    save_product_file(id_, file, verified=True)
+    store.add_to_store(id_, file, checksum)
+
+    return True
+
+
+def link_stored_product(id_):
+    """ Link a product from the shared store into the project, by the product ID alone.
+
+    Returns:
+        pathlib.Path: The product file in the project, or None if the store doesn't have the product.
+
+    Notes:
+        The store keeps the products under their IDs and names, so no metadata is needed, neither from the
+        database nor from the hub.
+
+    """
+
+    found = store.find_store_file(id_)
+
+    if found is None:
+        return None
+
+    store_file, verified = found
+    file = paths.raw_file_storage / store_file.name
+
+    file.parent.mkdir(parents=True, exist_ok=True)
+    store.link(store_file, file)
+    save_product_file(id_, file, verified=verified)
+
+    return file
+
+
+def save_product_file(id_, file, verified=False):
+    """ Record where a product was downloaded to and if it matched its checksum. """
+
+    with sqlite3.connect(paths.database) as connection:
+        cursor = connection.cursor()
+        cursor.execute(
+            'UPDATE metadata SET local_path = ?, checksum_verified = ? WHERE product_id = ?;',
+            (str(file), verified, id_)
+        )
+
+
+def get_md5(file):
+    """ Hash a file with MD5.
+
+     Returns:
+         The hash object, update it with more data or get the `hexdigest()`.
+
+    """
+
+    md5 = hashlib.md5()
+
+    with open(file, 'rb') as f:
+        while chunk := f.read(16 * feeds.CHUNK_SIZE):
+            md5.update(chunk)
+
+    return md5
+
+
+def get_downloaded_size(part_file):
+    """ Get the number of bytes downloaded to a `.part` file so far. """
+
+    try:
+        return segments.get_downloaded_size(part_file)
+    except FileNotFoundError:
+        # the file appears only once the response arrives
+        return part_file.stat().st_size if part_file.exists() else 0
+
+
+def wait_for_download_thread(download_thread, get_current_size, target_size):
+    """ Display the progress bar while waiting for the download thread to finish.
+
+     Args:
+         download_thread (concurrent.futures.Future): The download.
+         get_current_size (callable): Returns the number of bytes downloaded so far.
+         target_size (int): The size of the file.
+
+    """
 
     start_time = time.time()
 
     while download_thread.running():
-        current_size = pathlib.Path(file).stat().st_size
+        # a download that starts over can count bytes twice
+        current_size = min(get_current_size(), target_size)
 
         target_size_mb = round(target_size / 1024 / 1024, 1)
         current_size_mb = round(current_size / 1024 / 1024, 1)
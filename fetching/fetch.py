@@ -3,7 +3,9 @@
 import click
 
 from fetching import product
+from fetching import products
 from fetching import metadata
+from fetching import quicklooks
 
 
 @click.group()
@@ -14,4 +16,6 @@ def fetch():
 
 
 fetch.add_command(product)
+fetch.add_command(products)
 fetch.add_command(metadata)
+fetch.add_command(quicklooks)
@@ -43,3 +43,8 @@ def metadata(eumetsat):
         click.secho('\r\033[0J⚙ ', fg='red', nl=False)
         click.echo(f'Get request status code: {e.request.status_code} [{e.request.reason}]. Terminating.')
         return
+    except exceptions.MalformedFeedError as e:
+        # carriage return, clear line
+        click.secho('\r\033[0J⚙ ', fg='red', nl=False)
+        click.echo(f'The hub answered with a malformed feed [{e.reason}]. Terminating.')
+        return
@@ -1,28 +1,52 @@
 """ `sdm fetch product` command downloads individual products. """
 
-import shutil
+import zipfile
 import concurrent.futures
 
 import click
+import urllib3
 import requests
 
+import fetching.store as store
 import fetching.data_api as data_api
+import fetching.remote_zip as remote_zip
 import searching.search_api as search_api
 import configuration.urls as urls
 import configuration.paths as paths
+import configuration.sessions as sessions
+import configuration.database as database
 import configuration.exceptions as exceptions
-import configuration.authentication as authentication
 
 
 @click.command()
 @click.option('--id', 'id_', help='Fetch product with the given ID.')
 @click.option('--name', help='Fetch product with the given name.')
 @click.option('--eumetsat', is_flag=True, help='Send the request to EUMETSAT (for Sentinel-3 ocean data).')
-def product(id_, name, eumetsat):
-    """ Fetch individual products. """
+@click.option('--segments', type=int, help='Download over this many parallel connections (capped per hub).')
+@click.option('--member', multiple=True, help='Extract only the files that match this glob pattern (repeatable).')
+@click.option('--processed', is_flag=True, help='Extract the files into the processed file storage.')
+def product(id_, name, eumetsat, segments, member, processed):
+    """ Fetch individual products.
+
+    Notes:
+        With `--member`, only the matching files of the archive are fetched with Range requests and extracted,
+        e.g. `--member '*_B04_10m.jp2' --member '*/MTD_*.xml'`. The archive itself is not downloaded.
+
+    """
 
     if name is not None:
-        result = search_api.find_product_by_name(name, eumetsat=eumetsat)
+        try:
+            result = search_api.find_product_by_name(name, eumetsat=eumetsat)
+        except exceptions.FailedRequestError as e:
+            # carriage return, clear line
+            click.secho('\r\033[0J⚙ ', fg='red', nl=False)
+            click.echo(f'Get request status code: {e.request.status_code} [{e.request.reason}]. Terminating.')
+            return
+        except exceptions.MalformedFeedError as e:
+            # carriage return, clear line
+            click.secho('\r\033[0J⚙ ', fg='red', nl=False)
+            click.echo(f'The hub answered with a malformed feed [{e.reason}]. Terminating.')
+            return
 
         if result is None:
             # carriage return, clear line
@@ -38,12 +62,35 @@ def product(id_, name, eumetsat):
         click.echo(f'Not enough information to fetch a product.')
         return
 
-    result = data_api.fetch_metadata_by_id(id_, eumetsat=eumetsat)
-    id_, title, wkt, file_size, eumetsat, status = result
+    directory = paths.processed_file_storage if processed else paths.raw_file_storage
+
+    # a product that is downloaded and verified doesn't need the hub, unless its metadata is stale
+    result = data_api.find_downloaded_product(id_)
+
+    # neither does a product in the shared store, which is found by its ID before any request
+    stored_file = data_api.link_stored_product(id_) if result is None else None
+
+    if stored_file is not None:
+        if member:
+            fetch_members(id_, stored_file.stem, None, None, eumetsat, stored_file, member, directory)
+            return
+
+        # carriage return, clear line
+        click.secho(f'\r\033[0J✓ ', fg='green', nl=False)
+        click.echo(f'{stored_file.stem}')
+        return
+
+    id_, title, wkt, file_size, eumetsat, status, checksum = result or data_api.fetch_metadata_by_id(id_, eumetsat)
+    verified = database.get_product(id_)['checksum_verified']
 
     product_file = paths.raw_file_storage / f'{title}.zip'
+    downloaded = data_api.check_product_file(id_, product_file, file_size, checksum, verified)
+
+    if member:
+        fetch_members(id_, title, file_size, status, eumetsat, product_file if downloaded else None, member, directory)
+        return
 
-    if product_file.exists() and product_file.stat().st_size == file_size:
+    if downloaded:
         # carriage return, clear line
         click.secho(f'\r\033[0J✓ ', fg='green', nl=False)
         click.echo(f'{title}')
@@ -52,30 +99,129 @@ def product(id_, name, eumetsat):
     if status in ['offline', 'requested']:
         # carriage return, clear line
         click.secho('\r\033[0J✗ ', fg='red', nl=False)
-        click.echo(f'The product is not online. Use the watcher instead.')
+        click.echo(f'The product is not online. Use `sdm watch` instead.')
         return
 
     url = urls.get_product_url(id_, eumetsat=eumetsat) + '$value'
-    auth = authentication.get_authentication(eumetsat=eumetsat)
+    part_file = data_api.get_part_file(product_file)
+    settings = sessions.get_settings(eumetsat=eumetsat)
+    segments = min(segments or settings['segments'], settings['max segments'])
 
-    if auth is None:
-        raise exceptions.NoAuthenticationFoundError()
+    # carriage return, clear line
+    click.echo(f'\r\033[0J⏳ ', nl=False)
+    click.secho(f'{title}', bold=True)
 
-    with requests.get(url, stream=True, auth=auth) as request:
-        if request.status_code != 200:
-            # carriage return, clear line
-            click.secho('\r\033[0J⚙ ', fg='red', nl=False)
-            click.echo(f'Get request status code: {request.status_code} [{request.reason}]. Terminating.')
-            return
+    # the bytes are counted as they arrive, starting from what an interrupted download left
+    downloaded = [data_api.get_downloaded_size(part_file)]
 
-        # carriage return, clear line
-        click.echo(f'\r\033[0J⏳ ', nl=False)
-        click.secho(f'{title}', bold=True)
+    def on_chunk(chunk):
+        downloaded[0] += len(chunk)
 
+    try:
         with concurrent.futures.ThreadPoolExecutor() as executor:
-            download_thread = executor.submit(data_api.write_request_content_to_file, request, product_file)
-            executor.submit(data_api.wait_for_download_thread, download_thread, product_file, file_size)
+            download_thread = executor.submit(
+                data_api.download_product_file, url, product_file, file_size, checksum, eumetsat, segments, on_chunk
+            )
+            executor.submit(data_api.wait_for_download_thread, download_thread, lambda: downloaded[0], file_size)
+
+        complete = download_thread.result()
+    except exceptions.FailedRequestError as e:
+        # go to the beginning of previous line, clear line
+        click.secho('\033[1F\033[0J⚙ ', fg='red', nl=False)
+        click.echo(f'Get request status code: {e.request.status_code} [{e.request.reason}]. Terminating.')
+        return
+    except (requests.RequestException, urllib3.exceptions.HTTPError):
+        # go to the beginning of previous line, clear line
+        click.secho('\033[1F\033[0J⚙ ', fg='red', nl=False)
+        click.echo(f'Download of {title} interrupted. Run the command again to resume it.')
+        return
+    except exceptions.ChecksumMismatchError:
+        # go to the beginning of previous line, clear line
+        click.secho('\033[1F\033[0J✗ ', fg='red', nl=False)
+        click.echo(f'Download of {title} doesn\'t match its checksum, even on the second try.')
+        return
+
+    if not complete:
+        # go to the beginning of previous line, clear line
+        click.secho('\033[1F\033[0J✗ ', fg='red', nl=False)
+        click.echo(f'Download of {title} is incomplete. Run the command again to resume it.')
+        return
+
+    data_api.save_product_file(id_, product_file, verified=checksum is not None)
+    store.add_to_store(id_, product_file, checksum)
 
     # go to the beginning of previous line, clear line
     click.secho(f'\033[1F\033[0J✓ ', fg='green', nl=False)
     click.echo(f'{title}')
+
+
+def fetch_members(id_, title, file_size, status, eumetsat, product_file, patterns, directory):
+    """ Extract the files of a product that match the patterns, from the downloaded archive if there is one.
+
+     Args:
+         product_file (pathlib.Path): The downloaded archive, None to read the archive on the hub.
+         patterns (list of str): Glob patterns, see `remote_zip.extract_members`.
+         directory (pathlib.Path): Where the files are extracted to.
+
+    """
+
+    if product_file is None and status in ['offline', 'requested']:
+        # carriage return, clear line
+        click.secho('\r\033[0J✗ ', fg='red', nl=False)
+        click.echo(f'The product is not online. Use `sdm watch` instead.')
+        return
+
+    # carriage return, clear line
+    click.echo(f'\r\033[0J⏳ ', nl=False)
+    click.secho(f'{title}', bold=True)
+
+    directory.mkdir(parents=True, exist_ok=True)
+    transferred = [0]
+
+    def on_chunk(chunk):
+        transferred[0] += len(chunk)
+
+    try:
+        if product_file is not None:
+            with zipfile.ZipFile(product_file) as archive:
+                members = list(remote_zip.extract_members(archive, patterns, directory))
+        else:
+            url = urls.get_product_url(id_, eumetsat=eumetsat) + '$value'
+            members = []
+
+            for info in remote_zip.fetch_members(url, file_size, patterns, directory, eumetsat, on_chunk):
+                members.append(info)
+
+                # carriage return, clear line
+                click.echo(f'\r\033[0J    Extracted {len(members)} files', nl=False)
+                click.echo(f' [{round(transferred[0] / 1024 / 1024, 1)} MB transferred]', nl=False)
+    except exceptions.FailedRequestError as e:
+        # go to the beginning of previous line, clear line
+        click.secho('\033[1F\033[0J⚙ ', fg='red', nl=False)
+        click.echo(f'Get request status code: {e.request.status_code} [{e.request.reason}]. Terminating.')
+        return
+    except exceptions.RangeNotSupportedError:
+        # go to the beginning of previous line, clear line
+        click.secho('\033[1F\033[0J✗ ', fg='red', nl=False)
+        click.echo(f'The hub doesn\'t support partial downloads. Fetch the whole product instead.')
+        return
+    except (requests.RequestException, urllib3.exceptions.HTTPError):
+        # go to the beginning of previous line, clear line
+        click.secho('\033[1F\033[0J⚙ ', fg='red', nl=False)
+        click.echo(f'Extraction from {title} interrupted. Run the command again to continue it.')
+        return
+    except zipfile.BadZipFile:
+        # go to the beginning of previous line, clear line
+        click.secho('\033[1F\033[0J✗ ', fg='red', nl=False)
+        click.echo(f'{title} is not a valid archive, or a file in it is damaged.')
+        return
+
+    if not members:
+        # go to the beginning of previous line, clear line
+        click.secho('\033[1F\033[0J✗ ', fg='red', nl=False)
+        click.echo(f'No files in {title} match the patterns.')
+        return
+
+    # go to the beginning of previous line, clear line
+    click.secho(f'\033[1F\033[0J✓ ', fg='green', nl=False)
+    click.echo(f'{title}: {len(members)} files in {directory}, {round(transferred[0] / 1024 / 1024, 1)} MB transferred')
@@ -0,0 +1,80 @@
+""" `sdm fetch products` command downloads all queued products. """
+
+import click
+
+import meta.filters as filters
+import fetching.bulk as bulk
+import fetching.queue as queue
+import fetching.data_api as data_api
+import fetching.bandwidth as bandwidth
+import configuration.exceptions as exceptions
+
+
+@click.command()
+@filters.product_filters
+@click.option('--resume', is_flag=True, help='Continue the queued downloads without queueing new products.')
+@click.option('--bandwidth', 'bandwidth_limit', type=float, help='Limit all downloads together to this many MB/s.')
+def products(resume, bandwidth_limit, **options):
+    """ Queue the online products that match the filters, then download all queued products.
+
+    Notes:
+        The products are downloaded in the order of --sort, and the queue survives restarts: run the command with
+        --resume to continue, interrupted downloads resume from their `.part` files.
+
+    """
+
+    if not resume:
+        # only online products can be downloaded, the watcher takes care of the others
+        bulk.queue_products(options, default_statuses=('online',))
+
+    try:
+        for eumetsat in [False, True]:
+            ids = queue.get_queued_ids(eumetsat=eumetsat)
+
+            if not ids:
+                continue
+
+            # carriage return, clear line
+            click.echo(f'\r\033[0J⏳ Fetching metadata [0/{len(ids)}]', nl=False)
+
+            # the search results only have approximate sizes and may be out of date, the OData metadata is exact
+            for items_fetched in data_api.fetch_metadata_by_ids(ids, eumetsat=eumetsat):
+                # carriage return, clear line
+                click.echo(f'\r\033[0J⏳ Fetching metadata [{items_fetched}/{len(ids)}]', nl=False)
+    except exceptions.FailedRequestError as e:
+        # carriage return, clear line
+        click.secho('\r\033[0J⚙ ', fg='red', nl=False)
+        click.echo(f'Get request status code: {e.request.status_code} [{e.request.reason}]. Terminating.')
+        return
+    except exceptions.MalformedFeedError as e:
+        # carriage return, clear line
+        click.secho('\r\033[0J⚙ ', fg='red', nl=False)
+        click.echo(f'The hub answered with a malformed feed [{e.reason}]. Terminating.')
+        return
+
+    queued = queue.get_queued_products()
+    waiting = len(queue.get_queued_ids(eumetsat=False)) + len(queue.get_queued_ids(eumetsat=True)) - len(queued)
+
+    if not queued:
+        # carriage return, clear line
+        click.secho('\r\033[0J⚙ ', fg='yellow', nl=False)
+        click.echo(f'No online products in the queue ({waiting} waiting to come online).')
+        return
+
+    if bandwidth_limit is not None:
+        limit = bandwidth.get_limiter(int(bandwidth_limit * 1024 * 1024))
+    else:
+        limit = bandwidth.get_limiter(bandwidth.get_bandwidth())
+
+    done, failed = bulk.download_products(queued, limit)
+
+    if failed:
+        # carriage return, clear line
+        click.secho('\r\033[0J✗ ', fg='red', nl=False)
+        click.echo(f'Downloaded {done} of {len(queued)} products, {failed} failed.', nl=False)
+    else:
+        # carriage return, clear line
+        click.secho('\r\033[0J✓ ', fg='green', nl=False)
+        click.echo(f'Downloaded {done} of {len(queued)} products.', nl=False)
+
+    click.echo(f' {waiting} queued products are not online yet.' if waiting else '')
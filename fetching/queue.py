@@ -0,0 +1,74 @@
+""" Keep the queue of bulk downloads in the metadata database, so that it survives restarts. """
+
+import sqlite3
+
+import configuration.paths as paths
+
+# download_state values of the metadata table, products that were never queued have NULL
+QUEUED = 'queued'
+DONE = 'done'
+FAILED = 'failed'
+
+
+def enqueue(ids):
+    """ Queue products for download, after the products that are already queued.
+
+     Args:
+         ids (list of str): The product IDs in the order they should be downloaded.
+
+    Notes:
+         Products queued again move to their new place in the queue.
+
+    """
+
+    with sqlite3.connect(paths.database) as connection:
+        cursor = connection.cursor()
+        cursor.execute('SELECT coalesce(max(download_priority), 0) FROM metadata WHERE download_state = ?;', (QUEUED,))
+        last = cursor.fetchone()[0]
+
+        cursor.executemany(
+            'UPDATE metadata SET download_state = ?, download_priority = ? WHERE product_id = ?;',
+            [(QUEUED, last + i, id_) for i, id_ in enumerate(ids, 1)]
+        )
+
+
+def get_queued_ids(eumetsat=False):
+    """ Get the IDs of the queued products of a hub, in the order of the queue. """
+
+    with sqlite3.connect(paths.database) as connection:
+        cursor = connection.cursor()
+        cursor.execute(
+            'SELECT product_id FROM metadata WHERE download_state = ? AND eumetsat = ? ORDER BY download_priority;',
+            (QUEUED, int(eumetsat))
+        )
+        result = [row[0] for row in cursor.fetchall()]
+
+    return result
+
+
+def get_queued_products():
+    """ Get the queued products that are online, in the order of the queue.
+
+     Returns:
+         list of dict: The rows of the metadata table.
+
+    """
+
+    with sqlite3.connect(paths.database) as connection:
+        connection.row_factory = sqlite3.Row
+        cursor = connection.cursor()
+        cursor.execute(
+            'SELECT * FROM metadata WHERE download_state = ? AND status = "online" ORDER BY download_priority;',
+            (QUEUED,)
+        )
+        result = [dict(row) for row in cursor.fetchall()]
+
+    return result
+
+
+def set_download_state(id_, state):
+    """ Record the download state of a product. """
+
+    with sqlite3.connect(paths.database) as connection:
+        cursor = connection.cursor()
+        cursor.execute('UPDATE metadata SET download_state = ? WHERE product_id = ?;', (state, id_))
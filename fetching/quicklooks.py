@@ -0,0 +1,156 @@
+""" `sdm fetch quicklooks` command downloads quicklooks of many products at once. """
+
+import sqlite3
+import concurrent.futures
+
+import click
+import urllib3
+import requests
+
+import meta.filters as filters
+import configuration.urls as urls
+import configuration.paths as paths
+import configuration.config as config
+import configuration.sessions as sessions
+import configuration.exceptions as exceptions
+
+
+@click.command()
+@filters.product_filters
+def quicklooks(**options):
+    """ Fetch quicklooks for all products that match the filters.
+
+    Notes:
+        Quicklooks that are already in the quicklook storage are not downloaded again.
+
+    """
+
+    products_to_fetch = filters.select_products(**options)
+
+    if not products_to_fetch:
+        # carriage return, clear line
+        click.secho('\r\033[0J⚙ ', fg='yellow', nl=False)
+        click.echo('No products in the database match the filters.')
+        return
+
+    paths.quicklook_storage.mkdir(parents=True, exist_ok=True)
+
+    fetched, failed = 0, 0
+
+    try:
+        # carriage return, clear line
+        click.echo(f'\r\033[0J⏳ Fetching quicklooks [0/{len(products_to_fetch)}]', nl=False)
+
+        for processed, complete in fetch_quicklooks(products_to_fetch):
+            fetched += complete
+            failed += not complete
+
+            # carriage return, clear line
+            click.echo(f'\r\033[0J⏳ Fetching quicklooks [{processed}/{len(products_to_fetch)}]', nl=False)
+    except exceptions.NoAuthenticationFoundError:
+        # carriage return, clear line
+        click.secho('\r\033[0J⚙ ', fg='red', nl=False)
+        click.echo('No authentication found for the hub. Terminating.')
+        return
+
+    if failed:
+        # carriage return, clear line
+        click.secho('\r\033[0J✗ ', fg='red', nl=False)
+        click.echo(f'Fetched {fetched} of {len(products_to_fetch)} quicklooks, {failed} not available.')
+    else:
+        # carriage return, clear line
+        click.secho('\r\033[0J✓ ', fg='green', nl=False)
+        click.echo(f'Fetched {fetched} quicklooks.')
+
+
+def fetch_quicklooks(products_to_fetch):
+    """ Download the quicklooks of the products, every hub with as many connections as it allows.
+
+    Args:
+        products_to_fetch (list of dict): The rows of the metadata table.
+
+    Notes:
+        The function works like a generator, yielding the number of processed products and whether the last one
+        has its quicklook. Only the calling thread writes the quicklook paths to the database, in one transaction
+        per hub at the end.
+
+    """
+
+    hubs = {bool(product['eumetsat']) for product in products_to_fetch}
+    executors = {
+        hub: concurrent.futures.ThreadPoolExecutor(max_workers=config.get_hub_connections(eumetsat=hub))
+        for hub in hubs
+    }
+    futures = {
+        executors[bool(product['eumetsat'])].submit(fetch_quicklook, product): product
+        for product in products_to_fetch
+    }
+    saved = []
+
+    try:
+        for processed, future in enumerate(concurrent.futures.as_completed(futures), 1):
+            file = future.result()
+
+            if file is not None:
+                saved.append((str(file), futures[future]['product_id']))
+
+            yield processed, file is not None
+    finally:
+        for executor in executors.values():
+            executor.shutdown(cancel_futures=True)
+
+        save_quicklook_paths(saved)
+
+
+def fetch_quicklook(product):
+    """ Download the quicklook of a product, unless it is already there.
+
+     Returns:
+         pathlib.Path: The quicklook file, or None if the hub has no quicklook for the product.
+
+    """
+
+    file = get_quicklook_file(product)
+
+    if file.exists():
+        return file
+
+    eumetsat = bool(product['eumetsat'])
+    url = urls.get_quicklook_url(eumetsat=eumetsat).format(id=product['product_id']) + '$value'
+    temporary_file = file.with_name(file.name + '.part')
+
+    try:
+        with sessions.get(url, eumetsat=eumetsat) as request:
+            if request.status_code != 200:
+                return None
+
+            with open(temporary_file, 'wb') as f:
+                f.write(request.content)
+    except (requests.RequestException, urllib3.exceptions.HTTPError):
+        return None
+
+    temporary_file.replace(file)
+
+    return file
+
+
+def get_quicklook_file(product):
+    """ Get the file of a product's quicklook in the quicklook storage. """
+
+    return paths.quicklook_storage / f'{product["title"]}.jpeg'
+
+
+def save_quicklook_paths(saved):
+    """ Record the quicklook files of the products.
+
+     Args:
+         saved (list of tuple): Pairs of the quicklook file and the product ID.
+
+    """
+
+    if not saved:
+        return
+
+    with sqlite3.connect(paths.database) as connection:
+        cursor = connection.cursor()
+        cursor.executemany('UPDATE metadata SET quicklook_path = ? WHERE product_id = ?;', saved)
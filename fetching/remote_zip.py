@@ -0,0 +1,223 @@
+""" Extract individual members of a product archive without downloading the whole archive.
+
+The archive on the hub is read through a file object that turns reads into Range requests. `zipfile` finds the
+central directory at the end of the archive, and then only the compressed data of the wanted members is fetched.
+
+"""
+
+import io
+import fnmatch
+import zipfile
+
+import urllib3
+import requests
+
+import configuration.sessions as sessions
+import configuration.exceptions as exceptions
+
+# bytes fetched from the end of the archive at once, the central directory of most products fits into it
+TAIL_SIZE = 1024 * 1024
+
+
+class RemoteFile(io.RawIOBase):
+    """ A read-only, seekable file object for a file on a hub.
+
+    Args:
+        url (str): The URL of the file.
+        file_size (int): The size of the file.
+        eumetsat (bool): The URL belongs to EUMETSAT instead of Copernicus OA Hub.
+        on_chunk (callable): Called with every chunk of data received from the hub.
+
+    Notes:
+        The end of the file is fetched once and kept, as it holds the central directory of an archive. Other reads
+        stream from the position up to the next of the `boundaries`, e.g. the start of the next member of an
+        archive, so reading a member from start to end takes a single request.
+
+    """
+
+    def __init__(self, url, file_size, eumetsat=False, on_chunk=None):
+        super(RemoteFile, self).__init__()
+        self.url = url
+        self.file_size = file_size
+        self.eumetsat = eumetsat
+        self.on_chunk = on_chunk
+        self.retries = sessions.get_settings(eumetsat=eumetsat)['retries']
+        self.boundaries = []
+        self.position = 0
+        self.tail_start = max(file_size - TAIL_SIZE, 0)
+        self.tail = None
+        self.stream = None
+        self.stream_position = None
+        self.stream_end = None
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self.position
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_SET:
+            self.position = offset
+        elif whence == io.SEEK_CUR:
+            self.position += offset
+        elif whence == io.SEEK_END:
+            self.position = self.file_size + offset
+
+        return self.position
+
+    def readinto(self, buffer):
+        size = max(min(len(buffer), self.file_size - self.position), 0)
+        filled = 0
+
+        while filled < size:
+            if self.position >= self.tail_start:
+                data = self.read_tail(size - filled)
+            else:
+                data = self.read_stream(size - filled)
+
+            buffer[filled:filled + len(data)] = data
+            filled += len(data)
+            self.position += len(data)
+
+        return filled
+
+    def read_tail(self, size):
+        """ Read from the end of the file, fetching it on the first read. """
+
+        if self.tail is None:
+            tail = self.request(self.tail_start, self.file_size).content
+
+            if self.on_chunk is not None:
+                self.on_chunk(tail)
+
+            # a short tail would leave the rest of the file unreadable and the reads without progress
+            if len(tail) != self.file_size - self.tail_start:
+                raise urllib3.exceptions.ProtocolError('The response ended before the requested range.')
+
+            self.tail = tail
+
+        start = self.position - self.tail_start
+
+        return self.tail[start:start + size]
+
+    def read_stream(self, size):
+        """ Read from the stream at the position, opening a new one if the position moved elsewhere. """
+
+        for attempt in range(self.retries + 1):
+            try:
+                if self.stream is None or self.stream_position != self.position:
+                    self.close_stream()
+                    self.stream_end = self.get_boundary()
+                    self.stream = self.request(self.position, self.stream_end, stream=True)
+                    self.stream_position = self.position
+
+                data = self.stream.raw.read(min(size, self.stream_end - self.position))
+
+                if not data:
+                    raise urllib3.exceptions.ProtocolError('The response ended before the requested range.')
+
+                self.stream_position += len(data)
+
+                # a stream that was read to its end gives its connection back to the pool
+                if self.stream_position == self.stream_end:
+                    self.close_stream()
+
+                if self.on_chunk is not None:
+                    self.on_chunk(data)
+
+                return data
+            except (requests.ConnectionError, urllib3.exceptions.HTTPError):
+                self.close_stream()
+
+                if attempt == self.retries:
+                    raise
+
+    def get_boundary(self):
+        """ Get the first boundary after the position, the end of the streamed range. """
+
+        return min(boundary for boundary in [*self.boundaries, self.tail_start] if boundary > self.position)
+
+    def request(self, start, end, stream=False):
+        """ Request the bytes from `start` up to, not including, `end`. """
+
+        headers = {'Range': f'bytes={start}-{end - 1}'}
+        request = sessions.get(self.url, eumetsat=self.eumetsat, headers=headers, stream=stream)
+
+        if request.status_code == 206:
+            return request
+
+        request.close()
+
+        if request.status_code == 200:
+            raise exceptions.RangeNotSupportedError()
+
+        raise exceptions.FailedRequestError(request)
+
+    def close_stream(self):
+        if self.stream is not None:
+            self.stream.close()
+            self.stream = None
+
+    def close(self):
+        self.close_stream()
+        super(RemoteFile, self).close()
+
+
+def fetch_members(url, file_size, patterns, directory, eumetsat=False, on_chunk=None):
+    """ Extract the members of an archive on a hub that match any of the patterns.
+
+    Args:
+        url (str): The URL of the archive, e.g. the `$value` of a product.
+        file_size (int): The size of the archive.
+        patterns (list of str): Glob patterns, see `extract_members`.
+        directory (pathlib.Path): Where the members are extracted to.
+        eumetsat (bool): The URL belongs to EUMETSAT instead of Copernicus OA Hub.
+        on_chunk (callable): Called with every chunk of data received from the hub.
+
+    Returns:
+        generator: The extracted members, see `extract_members`.
+
+    """
+
+    with RemoteFile(url, file_size, eumetsat=eumetsat, on_chunk=on_chunk) as remote_file:
+        with zipfile.ZipFile(remote_file) as archive:
+            # every member starts where the previous one ends, and the last one ends at the central directory
+            remote_file.boundaries = [info.header_offset for info in archive.infolist()] + [archive.start_dir]
+
+            yield from extract_members(archive, patterns, directory)
+
+
+def extract_members(archive, patterns, directory):
+    """ Extract the members of an archive that match any of the patterns.
+
+    Args:
+        archive (zipfile.ZipFile): The archive, either a local file or a `RemoteFile`.
+        patterns (list of str): Glob patterns matched against the full names of the members, e.g. '*_B04_10m.jp2'
+            or '*/MTD_*.xml'. The `*` matches across directories.
+        directory (pathlib.Path): Where the members are extracted to, keeping their paths inside the archive.
+
+    Returns:
+        generator: The `zipfile.ZipInfo` of every matching member once it is extracted.
+
+    Notes:
+        Members that are already extracted with the right size are not extracted again. The members are extracted
+        in the order they are stored in, so a remote archive is read from start to end.
+
+    """
+
+    members = [
+        info for info in archive.infolist()
+        if not info.is_dir() and any(fnmatch.fnmatch(info.filename, pattern) for pattern in patterns)
+    ]
+
+    for info in sorted(members, key=lambda info: info.header_offset):
+        file = directory / info.filename
+
+        if not file.exists() or file.stat().st_size != info.file_size:
+            archive.extract(info, directory)
+
+        yield info
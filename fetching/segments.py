@@ -0,0 +1,200 @@
+""" Download a file over several connections at once, each one fetching its own byte range. """
+
+import json
+import time
+import threading
+import concurrent.futures
+
+import urllib3
+import requests
+
+import configuration.feeds as feeds
+import configuration.sessions as sessions
+import configuration.exceptions as exceptions
+
+# seconds between writes of the state file, the state is always written when a segment ends
+STATE_INTERVAL = 1
+
+
+def get_state_file(part_file):
+    """ Get the file that records the progress of every segment of a download. """
+
+    return part_file.with_name(part_file.name + '.segments')
+
+
+def get_downloaded_size(part_file):
+    """ Get the number of bytes a segmented download has written so far. """
+
+    with open(get_state_file(part_file), 'r') as f:
+        state = json.load(f)
+
+    return sum(segment['done'] for segment in state['segments'])
+
+
+def plan_segments(file_size, count):
+    """ Split a file into `count` byte ranges of about the same size.
+
+     Returns:
+         list of dict: Each segment has the first and the last byte (inclusive) and the number of bytes written.
+
+    """
+
+    bounds = [file_size * i // count for i in range(count + 1)]
+
+    return [
+        {'start': bounds[i], 'end': bounds[i + 1] - 1, 'done': 0}
+        for i in range(count) if bounds[i + 1] > bounds[i]
+    ]
+
+
+def load_state(part_file, file_size, count):
+    """ Load the state of an interrupted download, or preallocate the file and plan a new one. """
+
+    state_file = get_state_file(part_file)
+
+    if state_file.exists() and part_file.exists():
+        with open(state_file, 'r') as f:
+            state = json.load(f)
+
+        if state['size'] == file_size:
+            return state
+
+    with open(part_file, 'wb') as f:
+        f.truncate(file_size)
+
+    state = {'size': file_size, 'segments': plan_segments(file_size, count)}
+    save_state(part_file, state)
+
+    return state
+
+
+def save_state(part_file, state):
+    """ Write the state file, replacing the old one atomically. """
+
+    state_file = get_state_file(part_file)
+    temporary_file = state_file.with_name(state_file.name + '.tmp')
+
+    with open(temporary_file, 'w') as f:
+        json.dump(state, f)
+
+    temporary_file.replace(state_file)
+
+
+def download(url, part_file, file_size, count, eumetsat=False, on_chunk=None):
+    """ Download a file in `count` segments over parallel connections.
+
+    Args:
+        url (str): The URL to download.
+        part_file (pathlib.Path): The file to write to. It is preallocated to the full size.
+        file_size (int): The size of the file.
+        count (int): The number of segments for a new download. A resumed download keeps its segments.
+        eumetsat (bool): The URL belongs to EUMETSAT instead of Copernicus OA Hub.
+        on_chunk (callable): Called with every chunk of data after it is written, from the segments' threads.
+
+    Returns:
+        bool: True if all segments are complete. The state file is removed then.
+
+    Notes:
+        Every segment is retried on its own, see `fetch_segment`. When a segment fails anyway, the other segments
+        stop after their current chunk and its error is raised. If the server doesn't support Range requests,
+        the file and the state are removed and RangeNotSupportedError is raised.
+
+    """
+
+    state = load_state(part_file, file_size, count)
+    segments = [segment for segment in state['segments'] if segment['start'] + segment['done'] <= segment['end']]
+    lock = threading.Lock()
+    last_save = [time.time()]
+    stop = threading.Event()
+
+    def progress(segment, chunk):
+        if on_chunk is not None:
+            on_chunk(chunk)
+
+        size = len(chunk)
+
+        with lock:
+            segment['done'] += size
+
+            if time.time() - last_save[0] >= STATE_INTERVAL or segment['start'] + segment['done'] > segment['end']:
+                save_state(part_file, state)
+                last_save[0] = time.time()
+
+        # the chunk is counted, so the segment can stop here and resume from it later
+        if stop.is_set():
+            raise exceptions.CancelledDownloadError()
+
+    try:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max(len(segments), 1)) as executor:
+            futures = [
+                executor.submit(fetch_segment, url, part_file, segment, progress, eumetsat) for segment in segments
+            ]
+
+            done, _ = concurrent.futures.wait(futures, return_when=concurrent.futures.FIRST_EXCEPTION)
+            failed = [future for future in done if future.exception() is not None]
+
+            # a failed segment stops the others after their current chunk instead of letting them finish
+            if failed:
+                stop.set()
+                raise failed[0].exception()
+    except exceptions.RangeNotSupportedError:
+        part_file.unlink()
+        get_state_file(part_file).unlink()
+        raise
+    finally:
+        if get_state_file(part_file).exists():
+            with lock:
+                save_state(part_file, state)
+
+    if any(segment['start'] + segment['done'] <= segment['end'] for segment in state['segments']):
+        return False
+
+    get_state_file(part_file).unlink()
+
+    return True
+
+
+def fetch_segment(url, part_file, segment, progress, eumetsat=False):
+    """ Fetch the rest of a segment and write it to its place in the file.
+
+    Args:
+        url (str): The URL to download.
+        part_file (pathlib.Path): The preallocated file.
+        segment (dict): The segment, see `plan_segments`.
+        progress (callable): Called with the segment and the data after every written chunk.
+        eumetsat (bool): The URL belongs to EUMETSAT instead of Copernicus OA Hub.
+
+    Notes:
+        An interrupted segment is requested again from where it stopped, up to the hub's `Retries` times.
+
+    """
+
+    retries = sessions.get_settings(eumetsat=eumetsat)['retries']
+
+    for attempt in range(retries + 1):
+        start = segment['start'] + segment['done']
+
+        if start > segment['end']:
+            return
+
+        headers = {'Range': f'bytes={start}-{segment["end"]}'}
+
+        try:
+            with sessions.get(url, eumetsat=eumetsat, headers=headers, stream=True) as request:
+                if request.status_code == 200:
+                    raise exceptions.RangeNotSupportedError()
+
+                if request.status_code != 206:
+                    raise exceptions.FailedRequestError(request)
+
+                with open(part_file, 'r+b') as f:
+                    f.seek(start)
+
+                    for chunk in request.iter_content(feeds.CHUNK_SIZE):
+                        # the chunk must be on disk before the state file counts it
+                        f.write(chunk)
+                        f.flush()
+                        progress(segment, chunk)
+        except (requests.ConnectionError, requests.exceptions.ChunkedEncodingError, urllib3.exceptions.HTTPError):
+            if attempt == retries:
+                raise
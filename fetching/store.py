@@ -0,0 +1,124 @@
+""" Share product files between projects through a machine-wide store, see the `Store` section of the configuration.
+
+The store keeps every product under its ID and checksum. The raw file storage of a project holds hardlinks into the
+store, so a product downloaded by one project is never downloaded again by another, and takes disk space once.
+
+"""
+
+import os
+import shutil
+import pathlib
+
+import configuration.config as config
+
+
+def get_store():
+    """ Get the directory of the store from the configuration, None if there is no store. """
+
+    params = config.get_config().get('Store') or {}
+    path = params.get('Path')
+
+    return None if path in [None, 'none'] else pathlib.Path(path).expanduser()
+
+
+def get_store_file(store, id_, file, checksum=None):
+    """ Get the file of a product in the store, keyed by the product ID and the checksum if it is known. """
+
+    return store / id_ / checksum / file.name if checksum is not None else store / id_ / file.name
+
+
+def find_store_file(id_):
+    """ Find the file of a product in the store by the product ID alone, without its metadata.
+
+    Returns:
+        (pathlib.Path, bool): The file and whether it matched its checksum, or None if the store doesn't have it.
+
+     Notes:
+         Files under a checksum are preferred, they matched it before they were added to the store.
+
+    """
+
+    store = get_store()
+
+    if store is None:
+        return None
+
+    for pattern, verified in [('*/*.zip', True), ('*.zip', False)]:
+        for store_file in sorted((store / id_).glob(pattern)):
+            return store_file, verified
+
+    return None
+
+
+def link_from_store(id_, file, file_size=None, checksum=None):
+    """ Link a product file from the store into the project.
+
+    Args:
+        id_ (str): The product ID.
+        file (pathlib.Path): The product file in the project.
+        file_size (int): The expected size of the file, if known.
+        checksum (str): The expected MD5 digest of the file, if known.
+
+    Returns:
+        bool: True if the store has the file and it is linked now.
+
+    Notes:
+        Files with a checksum are only added to the store after they matched it, so they are not hashed again.
+
+    """
+
+    store = get_store()
+
+    if store is None:
+        return False
+
+    store_file = get_store_file(store, id_, file, checksum)
+
+    if not store_file.exists() or (file_size is not None and store_file.stat().st_size != file_size):
+        return False
+
+    file.parent.mkdir(parents=True, exist_ok=True)
+    link(store_file, file)
+
+    return True
+
+
+def add_to_store(id_, file, checksum=None):
+    """ Add a complete product file of the project to the store, unless the store already has it. """
+
+    store = get_store()
+
+    if store is None:
+        return
+
+    store_file = get_store_file(store, id_, file, checksum)
+
+    if store_file.exists():
+        return
+
+    store_file.parent.mkdir(parents=True, exist_ok=True)
+    link(file, store_file)
+
+
+def link(source, target):
+    """ Hardlink the target to the source, or copy the source where hardlinks don't work, e.g. across filesystems.
+
+     Notes:
+         The target appears atomically, so other projects never see a partial file.
+
+    """
+
+    # renaming over another link to the same file does nothing, and would leave the temporary file behind
+    if target.exists() and target.samefile(source):
+        return
+
+    # several projects can link the same file at once
+    temporary_file = target.with_name(f'{target.name}.{os.getpid()}.tmp')
+    temporary_file.unlink(missing_ok=True)
+
+    try:
+        os.link(source, temporary_file)
+    except OSError:
+        shutil.copyfile(source, temporary_file)
+
+    temporary_file.replace(target)
@@ -4,7 +4,9 @@ import sqlite3
 
 import click
 
+import meta.filters as filters
 import configuration.paths as paths
+import configuration.database as db
 
 
 @click.group()
@@ -29,6 +31,7 @@ def purge():
         with sqlite3.connect(paths.database) as connection:
             cursor = connection.cursor()
             cursor.execute('DELETE FROM metadata WHERE TRUE;')
+            cursor.execute('DELETE FROM footprint_index WHERE TRUE;')
 
         # carriage return, clear line
         click.secho('\r\033[0J⚙ ', fg='green', nl=False)
@@ -37,4 +40,51 @@ def purge():
     return
 
 
+@click.command()
+def reindex():
+    """ Rebuild the spatial index of product footprints. """
+
+    db.rebuild_footprint_index()
+
+    # carriage return, clear line
+    click.secho('\r\033[0J⚙ ', fg='green', nl=False)
+    click.echo(f'Footprint index rebuilt.')
+
+    return
+
+
+@click.command()
+@filters.product_filters
+@click.option('--ids', is_flag=True, help='Print only the product IDs, one per line.')
+def query(ids, **options):
+    """ Find products in the local database by their metadata, without contacting the hubs. """
+
+    products = filters.select_products(**options)
+
+    if ids:
+        for product in products:
+            click.echo(product['product_id'])
+        return
+
+    if not products:
+        # carriage return, clear line
+        click.secho('\r\033[0J✗ ', fg='red', nl=False)
+        click.echo('No products in the database match the filters.')
+        return
+
+    for product in products:
+        sensed = (product['sensing_start'] or '')[:10]
+        cloud = f'{product["cloud_cover"]:5.1f}%' if product['cloud_cover'] is not None else ''
+        size = f'{product["file_size"] / 1024 / 1024:8.1f} MB' if product['file_size'] is not None else ''
+        click.echo(f'{product["title"]:<70} {sensed:<10} {cloud:>6} {size:>11} {product["status"]}')
+
+    # carriage return, clear line
+    click.secho('\r\033[0J✓ ', fg='green', nl=False)
+    click.echo(f'{len(products)} matching product{"s" if len(products) != 1 else ""}.')
+
+    return
+
+
 database.add_command(purge)
+database.add_command(query)
+database.add_command(reindex)
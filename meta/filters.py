@@ -0,0 +1,88 @@
+""" Select products from the local catalog by their metadata, shared by the commands that work on many products. """
+
+import click
+import shapely.wkt
+import shapely.geometry
+import shapely.prepared
+
+import configuration.database as database
+
+STATUSES = ['found', 'online', 'offline', 'requested']
+SORT_COLUMNS = {
+    'date': 'sensing_start',
+    'newest': 'sensing_start DESC',
+    'size': 'file_size',
+    'largest': 'file_size DESC',
+    'cloud': 'cloud_cover',
+    'title': 'title',
+}
+
+
+def product_filters(command):
+    """ Add the product filter options to a click command. """
+
+    options = [
+        click.option('--start', type=click.DateTime(formats=['%Y-%m-%d']), help='Sensed on this day or later.'),
+        click.option('--end', type=click.DateTime(formats=['%Y-%m-%d']), help='Sensed on this day or earlier.'),
+        click.option('--platform', multiple=True, help='Platform name, e.g. Sentinel-2 (repeatable).'),
+        click.option('--product-type', 'product_type', multiple=True, help='Product type, e.g. S2MSI2A (repeatable).'),
+        click.option('--max-cloud', 'max_cloud', type=float, help='Maximum cloud cover percentage.'),
+        click.option('--status', multiple=True, type=click.Choice(STATUSES), help='Product status (repeatable).'),
+        click.option('--min-size', 'min_size', type=float, help='Minimum file size in MB.'),
+        click.option('--max-size', 'max_size', type=float, help='Maximum file size in MB.'),
+        click.option('--intersects', help='WKT geometry the footprint has to intersect.'),
+        click.option('--bbox', type=float, nargs=4, help='Bounding box the footprint has to intersect: W S E N.'),
+        click.option(
+            '--sort', type=click.Choice(list(SORT_COLUMNS)), default='date',
+            help='Order of the products, also their download priority.'
+        ),
+    ]
+
+    # click lists the options in the order the decorators are applied, which is the reverse of this list
+    for option in reversed(options):
+        command = option(command)
+
+    return command
+
+
+def select_products(start=None, end=None, platform=(), product_type=(), max_cloud=None, status=(), min_size=None,
+                    max_size=None, intersects=None, bbox=None, sort='date'):
+    """ Select the products that match the filter options added by `product_filters`.
+
+    Returns:
+        list of dict: The matching rows of the metadata table.
+
+    Notes:
+        The spatial filters first narrow the products down with the footprint index, then the footprints
+        are checked against the exact geometry. Products without a footprint never match a spatial filter.
+
+    """
+
+    geometry = None
+
+    if intersects is not None:
+        geometry = shapely.wkt.loads(intersects)
+    elif bbox:
+        geometry = shapely.geometry.box(*bbox)
+
+    products = database.find_products(
+        start_date=start.date() if start is not None else None,
+        end_date=end.date() if end is not None else None,
+        platforms=platform,
+        product_types=product_type,
+        max_cloud_cover=max_cloud,
+        statuses=status,
+        min_size=int(min_size * 1024 * 1024) if min_size is not None else None,
+        max_size=int(max_size * 1024 * 1024) if max_size is not None else None,
+        bounding_box=geometry.bounds if geometry is not None else None,
+        order_by=SORT_COLUMNS[sort],
+    )
+
+    if geometry is not None:
+        prepared = shapely.prepared.prep(geometry)
+        products = [
+            product for product in products
+            if product['footprint_wkt'] is not None and prepared.intersects(shapely.wkt.loads(product['footprint_wkt']))
+        ]
+
+    return products
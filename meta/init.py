@@ -1,24 +1,38 @@
 """ `sdm init` command manages the initialization of projects and configuration files. """
 
+import pathlib
+
 import click
 
 import configuration.paths as paths
 import configuration.database as db
 import configuration.config as config
 import configuration.workdir as workdir
+import configuration.telemetry as telemetry
 
 
 @click.command()
 @click.option('--generate-config', is_flag=True, help='Generate a new template configuration file.')
 @click.option('--generate-database', is_flag=True, help='Generate a new metadata database.')
 @click.option('--generate-geopackage', is_flag=True, help='Generate the metadata geopackage.')
-@click.option('--clean', is_flag=True, help='Delete the configuration files and the metadata database.')
+@click.option('--clean', is_flag=True, help='Delete the configuration files, the metadata database, and the telemetry.')
 def init(generate_config, generate_database, generate_geopackage, clean):
     """ Initialize the current directory as an SDM project. """
 
     if clean:
+        # the configuration says where the telemetry goes, so it is read before it is deleted
+        try:
+            telemetry_files = [paths.telemetry_log, *telemetry.get_settings()]
+        except FileNotFoundError:
+            telemetry_files = [paths.telemetry_log]
+
+        for file in telemetry_files:
+            if file is not None:
+                pathlib.Path(file).unlink(missing_ok=True)
+
         paths.config.unlink(missing_ok=True)
         paths.database.unlink(missing_ok=True)
+        paths.search_cache.unlink(missing_ok=True)
         paths.geopackage.unlink(missing_ok=True)
         click.secho('⚙ ', fg='green', nl=False)
         click.echo('Cleaning up complete.')
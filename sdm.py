@@ -5,19 +5,28 @@ import click
 from meta import init
 from meta import database
 from fetching import fetch
+from watching import watch
 from searching import search
 from searching import generate_query
 
+import configuration.paths as paths
+import configuration.database as db
+
 
 @click.group()
 def sdm():
     """ Sentinel Data Manager: manage Copernicus remote sensing data from the command line. """
 
+    # databases created by older versions are upgraded in place
+    if paths.database.exists():
+        db.migrate_metadata_database()
+
     return
 
 
 sdm.add_command(init)
 sdm.add_command(fetch)
+sdm.add_command(watch)
 sdm.add_command(search)
 sdm.add_command(database)
 sdm.add_command(generate_query)
@@ -0,0 +1,97 @@
+""" Cache Open Search responses on disk so that repeated searches don't hit the hubs. """
+
+import re
+import zlib
+import time
+import sqlite3
+import hashlib
+
+import configuration.paths as paths
+import configuration.config as config
+
+DEFAULT_TTL_HOURS = 24
+DEFAULT_MAX_SIZE_MB = 64
+
+
+def get_settings():
+    """ Get the time to live (in seconds) and the maximum size (in bytes) of the cache from the configuration. """
+
+    params = config.get_config().get('Search').get('Cache') or {}
+
+    ttl = params.get('TTL hours', DEFAULT_TTL_HOURS) * 3600
+    max_size = params.get('Max size MB', DEFAULT_MAX_SIZE_MB) * 1024 * 1024
+
+    return ttl, max_size
+
+
+def get_key(query, start, rows, eumetsat=False):
+    """ Get the cache key of a search request.
+
+     Notes:
+         The query is normalized first, so queries that differ only in whitespace share the key.
+
+    """
+
+    query = re.sub(r'\s+', ' ', query).strip()
+    hub = 'coda' if eumetsat else 'scihub'
+
+    return hashlib.sha256(f'{hub}\n{start}\n{rows}\n{query}'.encode()).hexdigest()
+
+
+def connect():
+    """ Open the cache database, creating it if necessary. """
+
+    connection = sqlite3.connect(paths.search_cache)
+    connection.execute(
+        'CREATE TABLE IF NOT EXISTS responses('
+        'key TEXT PRIMARY KEY,'
+        'content BLOB,'
+        'size INTEGER,'
+        'created REAL,'
+        'accessed REAL'
+        ');'
+    )
+
+    return connection
+
+
+def get(key):
+    """ Return the cached response body for the key, or None if there is no fresh one. """
+
+    ttl, _ = get_settings()
+
+    with connect() as connection:
+        cursor = connection.cursor()
+        cursor.execute('SELECT content FROM responses WHERE key = ? AND created > ?;', (key, time.time() - ttl))
+        result = cursor.fetchone()
+
+        if result is None:
+            return None
+
+        cursor.execute('UPDATE responses SET accessed = ? WHERE key = ?;', (time.time(), key))
+
+    return zlib.decompress(result[0])
+
+
+def put(key, content):
+    """ Cache a response body, evicting expired and least recently used responses to stay within the size limit. """
+
+    ttl, max_size = get_settings()
+    content = zlib.compress(content)
+    now = time.time()
+
+    with connect() as connection:
+        cursor = connection.cursor()
+        cursor.execute(
+            'INSERT OR REPLACE INTO responses(key, content, size, created, accessed) VALUES (?, ?, ?, ?, ?);',
+            (key, content, len(content), now, now)
+        )
+        cursor.execute('DELETE FROM responses WHERE created <= ?;', (now - ttl,))
+        cursor.execute(
+            'DELETE FROM responses WHERE key IN ('
+            'SELECT key FROM (SELECT key, sum(size) OVER (ORDER BY accessed DESC) AS total FROM responses) '
+            'WHERE total > ?'
+            ');',
+            (max_size,)
+        )
+
@@ -0,0 +1,238 @@
+""" Split the configured search into shards by mission, hub, ROI piece, and time, and execute them concurrently. """
+
+import datetime
+import concurrent.futures
+
+import searching.roi as roi
+import searching.tiles as mgrs
+import searching.search_api as api
+import configuration.config as config
+import configuration.database as database
+import configuration.authentication as authentication
+
+# Hubs refuse to page deep into large result sets, so shards with more results are split in time.
+MAX_SHARD_RESULTS = 2000
+
+# Every tile adds a filename term to the query, so large ROIs are searched for in groups of tiles.
+MAX_TILES_PER_SHARD = 40
+
+QUERY_GENERATORS = {
+    'Sentinel-1': api.generate_sentinel1_search_query,
+    'Sentinel-2': api.generate_sentinel2_search_query,
+    'Sentinel-3': api.generate_sentinel3_search_query,
+}
+
+
+def plan_search(eumetsat=None, full=False):
+    """ Split the configured search into shards, one per mission, hub, and piece of the ROI or group of tiles.
+
+    Args:
+        eumetsat (bool): Plan only for EUMETSAT (True) or only for Copernicus OA Hub (False); None plans for both.
+        full (bool): Ignore the ingestion date watermarks and search the whole date range.
+
+    Returns:
+        list of dict: The shards. Each has the mission, the hub, the date range, the ROI piece or the tiles
+        to search for (see `get_pieces`), the watermark key (the query of the whole date range and ROI),
+        and the watermark itself.
+
+    Notes:
+        Sentinel-3 is searched on both hubs, but on EUMETSAT only if there is authentication for it.
+
+    """
+
+    params = config.get_config().get('Search')
+    start_date, end_date = config.get_dates()
+    shards = []
+
+    for mission, generate_query in QUERY_GENERATORS.items():
+        if mission not in params:
+            continue
+
+        hubs = [False, True] if mission == 'Sentinel-3' else [False]
+
+        if eumetsat is not None:
+            hubs = [hub for hub in hubs if hub == eumetsat]
+        elif authentication.get_authentication(eumetsat=True) is None:
+            hubs = [hub for hub in hubs if not hub]
+
+        pieces = get_pieces(mission)
+
+        for hub in hubs:
+            key = generate_query()
+            since = None if full else database.get_search_watermark(key, eumetsat=hub)
+
+            for piece in pieces:
+                shards.append({
+                    'mission': mission,
+                    'eumetsat': hub,
+                    'start_date': start_date,
+                    'end_date': end_date,
+                    'key': key,
+                    'since': since,
+                    **piece,
+                })
+
+    return shards
+
+
+def get_pieces(mission):
+    """ Split the area of the search for the mission.
+
+     Returns:
+         list of dict: Each piece has the ROI WKT or the list of tiles to search for (None for the configured ones),
+         and whether the results should be checked against the exact ROI.
+
+    Notes:
+         Sentinel-2 with `Tiles: auto` is searched for by the tiles that intersect the ROI, in groups of up to
+         MAX_TILES_PER_SHARD. With a list of tiles, the ROI is ignored.
+
+    """
+
+    params = config.get_config().get('Search').get(mission)
+    tiles = params.get('Tiles') if mission == 'Sentinel-2' else None
+
+    if tiles == 'auto':
+        tiles = [f'T{tile}' for tile in mgrs.get_roi_tiles()]
+
+        if tiles:
+            return [
+                {'roi': None, 'tiles': tiles[i:i + MAX_TILES_PER_SHARD], 'filter': True}
+                for i in range(0, len(tiles), MAX_TILES_PER_SHARD)
+            ]
+    elif tiles is not None:
+        return [{'roi': None, 'tiles': None, 'filter': False}]
+
+    return [{'roi': piece, 'tiles': None, 'filter': True} for piece in roi.get_roi_pieces()]
+
+
+def get_group(shard):
+    """ Get the key that the results of a shard are collected under.
+
+     Notes:
+         Shards of a group differ only in ROI pieces and date ranges, so their results overlap.
+
+    """
+
+    return shard['key'], shard['eumetsat']
+
+
+def get_shard_query(shard):
+    """ Generate the query of a shard. """
+
+    generate_query = QUERY_GENERATORS[shard['mission']]
+    area = {'roi': shard['roi'], 'tiles': shard['tiles']} if shard['mission'] == 'Sentinel-2' else {'roi': shard['roi']}
+    query = generate_query(start_date=shard['start_date'], end_date=shard['end_date'], **area)
+
+    if shard['since'] is not None:
+        query = api.add_ingestion_filter(query, shard['since'])
+
+    return query
+
+
+def split_shard(shard):
+    """ Split the date range of a shard in two halves. """
+
+    days = (shard['end_date'] - shard['start_date']).days
+    middle = shard['start_date'] + datetime.timedelta(days=days // 2)
+
+    return [
+        dict(shard, end_date=middle),
+        dict(shard, start_date=middle + datetime.timedelta(days=1)),
+    ]
+
+
+def execute_plan(shards, results, use_cache=True, refresh_cache=False):
+    """ Fetch all pages of all shards concurrently.
+
+    Args:
+        shards (list of dict): Shards from `plan_search`.
+        results (dict): Filled with the entries of every group of shards: {group: {product ID: entry}}.
+        use_cache (bool): Read and store the responses in the search cache.
+        refresh_cache (bool): Ignore the cached responses, but store the new ones.
+
+    Notes:
+        The function works like a generator, yielding the number of fetched pages and the number of pages
+        known so far. Every hub gets its own pool, limited by its `Connections` setting. A shard that matches
+        more than MAX_SHARD_RESULTS products is replaced with the two halves of its date range.
+
+    """
+
+    hubs = {shard['eumetsat'] for shard in shards}
+    executors = {
+        hub: concurrent.futures.ThreadPoolExecutor(max_workers=config.get_hub_connections(eumetsat=hub))
+        for hub in hubs
+    }
+    pending = {}
+
+    def submit(shard, start):
+        # the results of an incremental query change with every new product, so they are not worth caching
+        cache = use_cache and shard['since'] is None
+        query = get_shard_query(shard)
+        future = executors[shard['eumetsat']].submit(
+            api.fetch_search_page, query, start, shard['eumetsat'], cache, refresh_cache
+        )
+        pending[future] = shard, start
+
+    for shard in shards:
+        results[get_group(shard)] = {}
+        submit(shard, 0)
+
+    pages_fetched, pages_known = 0, len(shards)
+
+    try:
+        while pending:
+            done, _ = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+
+            for future in done:
+                shard, start = pending.pop(future)
+                entries, total_results = future.result()
+                pages_fetched += 1
+
+                results[get_group(shard)].update((entry['product_id'], entry) for entry in entries)
+
+                if start == 0:
+                    if total_results > MAX_SHARD_RESULTS and shard['start_date'] < shard['end_date']:
+                        for half in split_shard(shard):
+                            submit(half, 0)
+                        pages_known += 2
+                    else:
+                        starts = api.get_page_starts(total_results)
+                        for page_start in starts:
+                            submit(shard, page_start)
+                        pages_known += len(starts)
+
+                yield pages_fetched, pages_known
+    finally:
+        for executor in executors.values():
+            executor.shutdown(cancel_futures=True)
+
+
+def save_results(shards, results):
+    """ Save the entries of all shards to the database and move the watermarks forward.
+
+     Returns:
+         new_count, total_count: The number of new products found and the total number of products that match.
+
+    Notes:
+         Entries found with the simplified ROI or by tiles that don't intersect the exact ROI are dropped.
+
+    """
+
+    new_count, total_count = 0, 0
+    groups = {get_group(shard): shard for shard in shards}
+
+    for group, shard in groups.items():
+        entries = list(results[group].values())
+        latest_ingestion_date = api.get_latest_ingestion_date(entries)
+
+        if shard['filter']:
+            entries = roi.filter_entries(entries)
+
+        new, total = api.save_search_entries(entries, eumetsat=shard['eumetsat'])
+        new_count += new
+        total_count += total
+
+        if latest_ingestion_date is not None:
+            database.update_search_watermark(shard['key'], latest_ingestion_date, eumetsat=shard['eumetsat'])
+
+    return new_count, total_count
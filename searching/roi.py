@@ -0,0 +1,171 @@
+""" Prepare the ROI for Open Search queries: simplify it and split it into pieces that keep the URLs short. """
+
+import shapely
+import shapely.wkt
+import shapely.prepared
+
+import configuration.config as config
+
+DEFAULT_SIMPLIFY_TOLERANCE = 0.001  # degrees, about 100 m
+DEFAULT_MAX_VERTICES = 250
+MAX_WKT_LENGTH = 6000  # characters, leaves room for the rest of the query in a GET URL
+WKT_PRECISION = 6
+
+
+def get_settings():
+    """ Get the simplification tolerance, the approximation, and the vertex budget from the configuration. """
+
+    params = config.get_config().get('Search').get('ROI')
+
+    tolerance = params.get('Simplify tolerance', DEFAULT_SIMPLIFY_TOLERANCE) or 0
+    approximation = params.get('Approximation') or 'none'
+    max_vertices = params.get('Max vertices', DEFAULT_MAX_VERTICES)
+
+    return tolerance, approximation, max_vertices
+
+
+def get_roi_geometry():
+    """ Get the exact ROI geometry, repaired if it is invalid (self-intersecting outlines are common). """
+
+    return config.get_derived('roi geometry', lambda: repair(shapely.wkt.loads(config.get_roi())))
+
+
+def repair(geometry):
+    """ Make the geometry valid, keeping only its polygons.
+
+     Notes:
+         Repairing an outline can leave lines and points next to the polygons, e.g. a spike that doubles back
+         becomes a line. They have no area, so they are dropped.
+
+    """
+
+    polygons = get_polygons(shapely.make_valid(geometry))
+
+    if not polygons:
+        raise ValueError('The ROI has no area.')
+
+    return polygons[0] if len(polygons) == 1 else shapely.MultiPolygon(polygons)
+
+
+def get_polygons(geometry):
+    """ Get the polygons of a geometry, from any depth of a collection. """
+
+    if geometry.geom_type == 'Polygon':
+        return [] if geometry.is_empty else [geometry]
+
+    return [polygon for part in getattr(geometry, 'geoms', []) for polygon in get_polygons(part)]
+
+
+def get_roi_pieces():
+    """ Get the WKT strings of the ROI pieces to search for.
+
+     Notes:
+         Each piece is a separate search, all of them together cover the ROI. The pieces are prepared
+         once per configuration snapshot.
+
+    """
+
+    return config.get_derived('roi pieces', compile_roi)
+
+
+def compile_roi():
+    """ Simplify or approximate the ROI, then split it into pieces within the vertex and URL length budgets. """
+
+    tolerance, approximation, max_vertices = get_settings()
+    geometry = get_roi_geometry()
+
+    if tolerance:
+        # simplified edges stray from the original ones by up to the tolerance, the buffer keeps the ROI covered
+        geometry = geometry.simplify(tolerance, preserve_topology=True).buffer(tolerance, join_style='mitre')
+
+    if approximation == 'convex hull':
+        geometry = geometry.convex_hull
+    elif approximation == 'envelope':
+        geometry = geometry.envelope
+    elif approximation != 'none':
+        raise ValueError(f'Unknown ROI approximation: {approximation}')
+
+    polygons, pieces = [], []
+
+    for polygon in getattr(geometry, 'geoms', [geometry]):
+        if fits(polygon, max_vertices):
+            polygons.append(polygon)
+        else:
+            # parts of a split polygon share edges, so they can't form a valid multipolygon and stay separate
+            pieces.extend(split_polygon(polygon, max_vertices))
+
+    return [to_wkt(piece) for piece in group_polygons(polygons, max_vertices) + pieces]
+
+
+def split_polygon(polygon, max_vertices, depth=0):
+    """ Split a polygon in halves across its longer side until every part is within the budgets. """
+
+    if fits(polygon, max_vertices) or depth >= 16:
+        return [polygon]
+
+    min_x, min_y, max_x, max_y = polygon.bounds
+
+    if max_x - min_x >= max_y - min_y:
+        middle = (min_x + max_x) / 2
+        halves = [shapely.box(min_x, min_y, middle, max_y), shapely.box(middle, min_y, max_x, max_y)]
+    else:
+        middle = (min_y + max_y) / 2
+        halves = [shapely.box(min_x, min_y, max_x, middle), shapely.box(min_x, middle, max_x, max_y)]
+
+    parts = []
+
+    for half in halves:
+        part = polygon.intersection(half)
+
+        for piece in getattr(part, 'geoms', [part]):
+            if piece.geom_type == 'Polygon' and not piece.is_empty:
+                parts.extend(split_polygon(piece, max_vertices, depth + 1))
+
+    return parts
+
+
+def group_polygons(polygons, max_vertices):
+    """ Pack disjoint polygons into as few multipolygons as the budgets allow. """
+
+    groups, group = [], []
+
+    for polygon in polygons:
+        if group and not fits(shapely.MultiPolygon(group + [polygon]), max_vertices):
+            groups.append(group)
+            group = []
+
+        group.append(polygon)
+
+    if group:
+        groups.append(group)
+
+    return [group[0] if len(group) == 1 else shapely.MultiPolygon(group) for group in groups]
+
+
+def fits(geometry, max_vertices):
+    """ Check if the geometry is within the vertex and URL length budgets. """
+
+    return shapely.get_num_coordinates(geometry) <= max_vertices and len(to_wkt(geometry)) <= MAX_WKT_LENGTH
+
+
+def to_wkt(geometry):
+    """ Format the geometry for a query, with the precision the hubs work with. """
+
+    return shapely.wkt.dumps(geometry, rounding_precision=WKT_PRECISION, trim=True)
+
+
+def filter_entries(entries):
+    """ Drop the search result entries whose footprints don't intersect the exact ROI.
+
+     Notes:
+         Searches use a simplified ROI, so they can match products that only touch the approximation.
+         Entries without a footprint are kept.
+
+    """
+
+    roi = shapely.prepared.prep(get_roi_geometry())
+
+    return [
+        entry for entry in entries
+        if entry['footprint_wkt'] is None or roi.intersects(shapely.wkt.loads(entry['footprint_wkt']))
+    ]
@@ -1,18 +1,18 @@
 """ `sdm search` command generates and executes a query using configuration files. """
 
-import concurrent.futures
-
 import click
 
-import searching.search_api as api
+import searching.planner as planner
 import configuration.config as config
+import configuration.exceptions as exceptions
 
 
 @click.command()
-@click.option('--eumetsat', is_flag=True, help='Send the request to EUMETSAT (for Sentinel-3 ocean data).')
-@click.option('--start', default=0, show_default=True,
-              help='When many products are matched (>100), this specifies the first to return.')
-def search(eumetsat, start):
+@click.option('--eumetsat', is_flag=True, help='Search only EUMETSAT (for Sentinel-3 ocean data).')
+@click.option('--no-cache', 'no_cache', is_flag=True, help='Neither read nor store responses in the search cache.')
+@click.option('--refresh', is_flag=True, help='Ignore cached responses, but store the new ones.')
+@click.option('--full', is_flag=True, help='Search the whole date range, not only products new since the last run.')
+def search(eumetsat, no_cache, refresh, full):
     """ Execute a search request based on the configuration. """
 
     try:
@@ -25,33 +25,37 @@ def search(eumetsat, start):
 
     search_params = params.get('Search')
 
-    if eumetsat:
-        if 'Sentinel-3' not in search_params:
-            # carriage return, clear line
-            click.secho('\r\033[0J⚙ ', fg='red', nl=False)
-            click.echo('Search is not configured for Sentinel-3. Terminating.')
-            return
+    if eumetsat and 'Sentinel-3' not in search_params:
+        # carriage return, clear line
+        click.secho('\r\033[0J⚙ ', fg='red', nl=False)
+        click.echo('Search is not configured for Sentinel-3. Terminating.')
+        return
 
-        query = api.generate_query(s1=False, s2=False, s3=True)
-    else:
-        s1 = 'Sentinel-1' in search_params
-        s2 = 'Sentinel-2' in search_params
-        s3 = 'Sentinel-3' in search_params
-        query = api.generate_query(s1=s1, s2=s2, s3=s3)
+    # without the flag, both hubs are searched
+    shards = planner.plan_search(eumetsat=True if eumetsat else None, full=full)
+    results = {}
 
-    with concurrent.futures.ThreadPoolExecutor() as executor:
-        search_thread = executor.submit(api.execute_search_query, query, start, eumetsat)
-        executor.submit(api.wait_for_search_thread, search_thread)
+    try:
+        # carriage return, clear line
+        click.echo(f'\r\033[0J⏳ Searching for matching products [0/{len(shards)} pages]', nl=False)
 
-    search_request = search_thread.result()
+        pages = planner.execute_plan(shards, results, use_cache=not no_cache, refresh_cache=refresh)
 
-    if search_request.status_code != 200:
+        for pages_fetched, pages_known in pages:
+            # carriage return, clear line
+            click.echo(f'\r\033[0J⏳ Searching for matching products [{pages_fetched}/{pages_known} pages]', nl=False)
+    except exceptions.FailedRequestError as e:
+        # carriage return, clear line
+        click.secho('\r\033[0J⚙ ', fg='red', nl=False)
+        click.echo(f'Search request status code: {e.request.status_code} [{e.request.reason}]. Terminating.')
+        return
+    except exceptions.MalformedFeedError as e:
         # carriage return, clear line
         click.secho('\r\033[0J⚙ ', fg='red', nl=False)
-        click.echo(f'Search request status code: {search_request.status_code} [{search_request.reason}]. Terminating.')
+        click.echo(f'The hub answered with a malformed feed [{e.reason}]. Terminating.')
         return
 
-    new_count, total_count = api.process_search_request(search_request, eumetsat=eumetsat)
+    new_count, total_count = planner.save_results(shards, results)
 
     if (new_count, total_count) == (0, 0):
         # carriage return, clear line
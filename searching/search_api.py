@@ -1,42 +1,156 @@
 """ Manage the Copernicus / EUMETSAT OpenSearch API. """
 
-import time
 import sqlite3
+import datetime
 
-import click
-import requests
-import feedparser
-
+import searching.cache as cache
+import searching.tiles as mgrs
 import configuration.urls as urls
+import configuration.feeds as feeds
 import configuration.paths as paths
+import configuration.sessions as sessions
 import configuration.config as config
 import configuration.database as database
 import configuration.exceptions as exceptions
-import configuration.authentication as authentication
 
 
-def execute_search_query(query, start, eumetsat=False):
+ROWS_PER_PAGE = 100  # the maximum page size Open Search allows
+
+
+def execute_search_query(query, start, eumetsat=False, rows=ROWS_PER_PAGE):
     """ Send a GET request with the query to Copernicus/EUMETSAT Open Search API.
 
     Args:
         query (str): A query to use.
         start (int): Controls paging of Open Search. It returns 100 rows max, this will set the starting row.
         eumetsat (bool): Use Eumetsat instead of Copernicus OA Hub (for Sentinel-3 ocean data).
+        rows (int): The number of rows to request.
 
     Returns:
-        request: A resulting GET request.
+        request: A resulting GET request. The body is streamed, use `parse_search_request` to read it.
 
     """
 
     url = urls.get_search_url(eumetsat=eumetsat)
-    auth = authentication.get_authentication(eumetsat=eumetsat)
+    request = sessions.get(url, eumetsat=eumetsat, params={'q': query, 'start': start, 'rows': rows}, stream=True)
 
-    if auth is None:
-        raise exceptions.NoAuthenticationFoundError()
+    return request
 
-    request = requests.get(url, params={'q': query, 'start': start, 'rows': 100}, auth=auth)
 
-    return request
+def parse_search_request(request):
+    """ Parse a page of search results.
+
+     Returns:
+         entries, total_results: The entries of the page and the total number of products that match the query.
+
+    Notes:
+         Each entry is a dictionary with values for columns of the database.
+
+    """
+
+    total_results, entries = feeds.parse_search_feed(request.iter_content(feeds.CHUNK_SIZE))
+
+    return list(entries), total_results
+
+
+def fetch_search_page(query, start, eumetsat=False, use_cache=True, refresh_cache=False):
+    """ Fetch and parse a page of search results, going through the response cache.
+
+    Args:
+        query (str): A query to use.
+        start (int): The starting row of the page.
+        eumetsat (bool): Use Eumetsat instead of Copernicus OA Hub (for Sentinel-3 ocean data).
+        use_cache (bool): Read and store the response in the cache.
+        refresh_cache (bool): Ignore the cached response, but store the new one.
+
+    Returns:
+        entries, total_results: The entries of the page and the total number of products that match the query.
+
+    """
+
+    key = cache.get_key(query, start, ROWS_PER_PAGE, eumetsat=eumetsat)
+
+    if use_cache and not refresh_cache:
+        content = cache.get(key)
+
+        if content is not None:
+            try:
+                total_results, entries = feeds.parse_search_feed([content])
+                return list(entries), total_results
+            except exceptions.MalformedFeedError:
+                # a damaged cached response is fetched again, which replaces it in the cache
+                pass
+
+    # the body is streamed, closing the response gives its connection back to the pool whatever happens
+    with execute_search_query(query, start, eumetsat=eumetsat) as request:
+        if request.status_code != 200:
+            raise exceptions.FailedRequestError(request)
+
+        if not use_cache:
+            return parse_search_request(request)
+
+        # the whole body is kept anyway to be cached
+        content = request.content
+
+    total_results, entries = feeds.parse_search_feed([content])
+    entries = list(entries)
+
+    cache.put(key, content)
+
+    return entries, total_results
+
+
+def get_page_starts(total_results, start=0):
+    """ Get the starting rows of the pages that follow the one starting at `start`. """
+
+    return list(range(start + ROWS_PER_PAGE, total_results, ROWS_PER_PAGE))
+
+
+def save_search_entries(entries, eumetsat=False):
+    """ Save product metadata from search result entries to the database.
+
+     Returns:
+         new_count, total_count: The number of new products found and the total number of products that match.
+
+    Notes:
+         All entries are upserted in a single transaction. Sizes from the search results are approximate,
+         so an exact size that was fetched before is never overwritten. Neither is the status of products
+         that were requested from the Long Term Archive and are still offline.
+
+    """
+
+    if not entries:
+        return 0, 0
+
+    query = 'INSERT INTO metadata(product_id, title, footprint_wkt, file_size, eumetsat, status, platform, ' \
+            'product_type, sensing_start, sensing_end, ingestion_date, cloud_cover) VALUES (:product_id, :title, ' \
+            ':footprint_wkt, :file_size, :eumetsat, :status, :platform, :product_type, :sensing_start, ' \
+            ':sensing_end, :ingestion_date, :cloud_cover) ON CONFLICT(product_id) DO UPDATE SET ' \
+            'footprint_wkt = coalesce(footprint_wkt, excluded.footprint_wkt), ' \
+            'file_size = coalesce(file_size, excluded.file_size), ' \
+            'platform = excluded.platform, product_type = excluded.product_type, ' \
+            'sensing_start = excluded.sensing_start, sensing_end = excluded.sensing_end, ' \
+            'ingestion_date = excluded.ingestion_date, cloud_cover = excluded.cloud_cover, ' \
+            'status = CASE WHEN excluded.status = "found" THEN status ' \
+            'WHEN status = "requested" AND excluded.status = "offline" THEN status ' \
+            'ELSE excluded.status END;'
+
+    # the same product can show up on two pages if the results shift while paging
+    entries = {entry['product_id']: dict(entry, eumetsat=int(eumetsat)) for entry in entries}
+
+    with sqlite3.connect(paths.database) as connection:
+        cursor = connection.cursor()
+
+        cursor.execute('SELECT count(*) FROM metadata;')
+        old_size = cursor.fetchone()[0]
+
+        cursor.executemany(query, entries.values())
+        database.index_footprints(cursor, entries.keys())
+
+        cursor.execute('SELECT count(*) FROM metadata;')
+        new_count = cursor.fetchone()[0] - old_size
+
+    return new_count, len(entries)
 
 
 def process_search_request(request, eumetsat=False):
@@ -47,34 +161,21 @@ def process_search_request(request, eumetsat=False):
 
     """
 
-    feed = feedparser.parse(request.content)
-    entries = feed['entries']
+    entries, _ = parse_search_request(request)
 
-    if entries:
-        lookup_query = 'SELECT count(*) FROM metadata WHERE product_id = ?;'
-        insert_query = 'INSERT INTO metadata(product_id, title, eumetsat, status) VALUES (?, ?, ?, ?);'
-        new_count, old_count = 0, 0
+    return save_search_entries(entries, eumetsat=eumetsat)
 
-        with sqlite3.connect(paths.database) as connection:
-            cursor = connection.cursor()
 
-            for entry in entries:
-                # we don't need to do anything if the product is already in the database
-                cursor.execute(lookup_query, (entry['id'],))
-                if cursor.fetchone()[0] == 1:
-                    old_count += 1
-                    continue
+def add_ingestion_filter(query, since):
+    """ Restrict the query to products ingested at or after the date (an Open Search timestamp). """
 
-                # everything else is not yet in the database
-                cursor.execute(
-                    insert_query,
-                    (entry['id'], entry['title'], int(eumetsat), 'found')
-                )
-                new_count += 1
+    return f'({query}) AND ingestiondate:[{since} TO NOW]'
 
-        return new_count, new_count + old_count
-    else:
-        return 0, 0
+
+def get_latest_ingestion_date(entries):
+    """ Return the latest ingestion date among the search result entries, or None if none is known. """
+
+    return max((entry['ingestion_date'] for entry in entries if entry['ingestion_date'] is not None), default=None)
 
 
 def generate_query(s1, s2, s3):
@@ -109,11 +210,34 @@ def generate_query(s1, s2, s3):
     return query
 
 
-def generate_sentinel1_search_query():
-    """ Generate a search query for Sentinel-1 based on the configuration. """
+def format_date_range(start_date, end_date):
+    """ Format the sensing date range for a query.
+
+     Notes:
+         An end date of today is sent as NOW, so that a query with `End date: today` stays the same
+         from day to day and keeps its ingestion date watermark.
+
+    """
+
+    end = 'NOW' if end_date == datetime.datetime.now().date() else f'{end_date}T23:59:59.999Z'
+
+    return f'[{start_date}T00:00:00.000Z TO {end}]'
+
 
-    roi = config.get_roi()
-    start_date, end_date = config.get_dates()
+def generate_sentinel1_search_query(start_date=None, end_date=None, roi=None):
+    """ Generate a search query for Sentinel-1 based on the configuration.
+
+     Args:
+         start_date (datetime.date): Use instead of the configured start date.
+         end_date (datetime.date): Use instead of the configured end date.
+         roi (str): Use this WKT instead of the configured ROI.
+
+    """
+
+    roi = roi or config.get_roi()
+    configured_start_date, configured_end_date = config.get_dates()
+    start_date = start_date or configured_start_date
+    end_date = end_date or configured_end_date
 
     params = config.get_config().get('Search').get('Sentinel-1')
 
@@ -123,17 +247,30 @@ def generate_sentinel1_search_query():
     query = 'platformname:Sentinel-1 '
     query += f'AND {params["Sensor mode"]} '
     query += f'AND {params["Product type"]} AND beginposition:'
-    query += f'[{start_date}T00:00:00.000Z TO {end_date}T23:59:59.999Z] '
+    query += f'{format_date_range(start_date, end_date)} '
     query += f'AND footprint:"Intersects({roi})"'
 
     return query
 
 
-def generate_sentinel2_search_query():
-    """ Generate a search query for Sentinel-2 based on the configuration. """
+def generate_sentinel2_search_query(start_date=None, end_date=None, roi=None, tiles=None):
+    """ Generate a search query for Sentinel-2 based on the configuration.
+
+     Args:
+         start_date (datetime.date): Use instead of the configured start date.
+         end_date (datetime.date): Use instead of the configured end date.
+         roi (str): Use this WKT instead of the configured ROI.
+         tiles (list of str): Use these tiles instead of the configured ones.
 
-    roi = config.get_roi()
-    start_date, end_date = config.get_dates()
+    Notes:
+         With `Tiles: auto`, the tiles that intersect the ROI are searched for instead of the ROI itself.
+
+    """
+
+    roi = roi or config.get_roi()
+    configured_start_date, configured_end_date = config.get_dates()
+    start_date = start_date or configured_start_date
+    end_date = end_date or configured_end_date
 
     params = config.get_config().get('Search').get('Sentinel-2')
 
@@ -142,16 +279,21 @@ def generate_sentinel2_search_query():
 
     query = 'platformname:Sentinel-2 '
     query += f'AND producttype:{params["Product type"]} AND beginposition:'
-    query += f'[{start_date}T00:00:00.000Z TO {end_date}T23:59:59.999Z] '
+    query += f'{format_date_range(start_date, end_date)} '
 
     if params.get('Max cloud cover %') is not None:
         query += f'cloudcoverpercentage:[0 TO {params.get("Max cloud cover %")}] '
 
-    if params.get('Tiles') is not None:
-        if len(params.get('Tiles')) == 1:
-            query += f'AND filename:*{params.get("Tiles")[0]}* '
+    tiles = tiles or params.get('Tiles')
+
+    if tiles == 'auto':
+        tiles = [f'T{tile}' for tile in mgrs.get_roi_tiles()]
+
+    if tiles:
+        if len(tiles) == 1:
+            query += f'AND filename:*{tiles[0]}* '
         else:
-            terms = [f'filename:*{tile}*' for tile in params.get('Tiles')]
+            terms = [f'filename:*{tile}*' for tile in tiles]
             query += f'AND ({" OR ".join(terms)})'
     else:
         query += f'AND footprint:"Intersects({roi})"'
@@ -159,11 +301,20 @@ def generate_sentinel2_search_query():
     return query
 
 
-def generate_sentinel3_search_query():
-    """ Generate a search query for Sentinel-3 based on the configuration. """
+def generate_sentinel3_search_query(start_date=None, end_date=None, roi=None):
+    """ Generate a search query for Sentinel-3 based on the configuration.
 
-    roi = config.get_roi()
-    start_date, end_date = config.get_dates()
+     Args:
+         start_date (datetime.date): Use instead of the configured start date.
+         end_date (datetime.date): Use instead of the configured end date.
+         roi (str): Use this WKT instead of the configured ROI.
+
+    """
+
+    roi = roi or config.get_roi()
+    configured_start_date, configured_end_date = config.get_dates()
+    start_date = start_date or configured_start_date
+    end_date = end_date or configured_end_date
 
     params = config.get_config().get('Search').get('Sentinel-3')
 
@@ -171,7 +322,7 @@ def generate_sentinel3_search_query():
         return ""
 
     query = 'platformname:Sentinel-3 AND beginposition:'
-    query += f'[{start_date}T00:00:00.000Z TO {end_date}T23:59:59.999Z] '
+    query += f'{format_date_range(start_date, end_date)} '
 
     if len(params.get('Instruments')) == 1:
         query += f'AND instrumentshortname:{params.get("Instruments")[0]} '
@@ -185,23 +336,14 @@ def generate_sentinel3_search_query():
     return query
 
 
-def wait_for_search_thread(search_thread):
-    """ Display the loading animation while waiting for the searching thread to finish. """
-
-    symbols = list('|/-\\')
-    index = 0
-
-    while search_thread.running():
-        click.echo(f'\r{symbols[index]} Searching for matching products...', nl=False)
-        time.sleep(0.1)
-        index = index + 1 if index < 3 else 0
-
-
 def find_product_by_name(name, eumetsat=False):
     """ Execute a simple search query for a single product by its name.
 
+     Returns:
+         The database row of the product, or None if there is no product with that name.
+
      Notes:
-         Returns True when the request was successful.
+         Raises FailedRequestError if the hub doesn't answer the search with a page of results.
 
     """
 
@@ -210,8 +352,11 @@ def find_product_by_name(name, eumetsat=False):
     if result is not None:
         return result
 
-    request = execute_search_query(query=name, start=0, eumetsat=eumetsat)
-    new, total = process_search_request(request, eumetsat=eumetsat)
+    with execute_search_query(query=name, start=0, eumetsat=eumetsat) as request:
+        if request.status_code != 200:
+            raise exceptions.FailedRequestError(request)
+
+        new, total = process_search_request(request, eumetsat=eumetsat)
 
     if total == 0:
         return
@@ -0,0 +1,154 @@
+""" Find the Sentinel-2 tiles that cover the ROI without asking the hub.
+
+Sentinel-2 tiles are the 100 km squares of the Military Grid Reference System, extended by 9.8 km to the east
+and to the south so that neighbours overlap. The squares follow from the UTM grid itself, so instead of shipping
+the tile geometries the index computes them: the ROI is projected into every UTM zone it is close to, and the
+grid cells around it are checked one by one.
+
+"""
+
+import math
+import functools
+
+import numpy
+import pyproj
+import shapely
+
+import searching.roi as roi
+import configuration.config as config
+
+SQUARE_SIZE = 100_000  # m
+TILE_SIZE = 109_800  # m
+
+COLUMN_LETTERS = ['ABCDEFGH', 'JKLMNPQR', 'STUVWXYZ']  # by (zone - 1) % 3
+ROW_LETTERS = 'ABCDEFGHJKLMNPQRSTUV'
+BAND_LETTERS = 'CDEFGHJKLMNPQRSTUVWX'  # 8° bands from 80°S, X spans 72°N to 84°N
+
+# tiles can reach into the neighbouring zones, so zones that far away from the ROI are checked as well
+ZONE_MARGIN = 3  # degrees
+
+
+def get_roi_tiles():
+    """ Get the IDs of the tiles that intersect the ROI, e.g. ['35VPG', '36VUM'].
+
+     Notes:
+         The tiles are found once per configuration snapshot.
+
+    """
+
+    return config.get_derived('roi tiles', lambda: find_tiles(roi.get_roi_geometry()))
+
+
+def find_tiles(geometry):
+    """ Find the IDs of the tiles that intersect a geometry in geographic coordinates. """
+
+    min_lon, min_lat, max_lon, max_lat = geometry.bounds
+    tiles = set()
+
+    first_zone = get_zone(max(min_lon - ZONE_MARGIN, -180))
+    last_zone = get_zone(min(max_lon + ZONE_MARGIN, 179.999))
+
+    for zone in range(first_zone, last_zone + 1):
+        for south in [False, True]:
+            hemisphere = shapely.box(-180, -80, 180, 0) if south else shapely.box(-180, 0, 180, 84)
+            part = geometry.intersection(hemisphere)
+
+            if not part.is_empty:
+                tiles.update(find_zone_tiles(part, zone, south))
+
+    return sorted(tiles)
+
+
+def find_zone_tiles(geometry, zone, south):
+    """ Find the tiles of one UTM zone that intersect a geometry. """
+
+    projected = project(geometry, get_transformer(zone, south))
+    strip = get_zone_strip(zone, south)
+
+    min_x, min_y, max_x, max_y = projected.bounds
+    tiles = []
+
+    # a tile reaches TILE_SIZE east of its square's western edge and TILE_SIZE south of its northern edge
+    for column in range(math.floor((min_x - TILE_SIZE) / SQUARE_SIZE) + 1, math.floor(max_x / SQUARE_SIZE) + 1):
+        # columns of 100 km squares run from 100 000 m to 900 000 m eastings
+        if not 1 <= column <= 8:
+            continue
+
+        for row in range(math.floor(min_y / SQUARE_SIZE), math.floor((max_y + TILE_SIZE) / SQUARE_SIZE - 1) + 1):
+            # the grid of each hemisphere ends at the equator, where southern northings reach 10 000 000 m
+            if (south and row >= 100) or (not south and row < 0):
+                continue
+
+            west, north = column * SQUARE_SIZE, (row + 1) * SQUARE_SIZE
+            square = shapely.box(west, north - SQUARE_SIZE, west + SQUARE_SIZE, north)
+
+            # squares outside of the zone don't belong to its grid
+            if not square.intersects(strip):
+                continue
+
+            tile = shapely.box(west, north - TILE_SIZE, west + TILE_SIZE, north)
+
+            # tiles that only touch the ROI don't cover any of it
+            if tile.intersection(projected).area > 0:
+                tiles.extend(get_tile_ids(zone, south, column, row, square))
+
+    return tiles
+
+
+def get_tile_ids(zone, south, column, row, square):
+    """ Name the tile of a grid square, once for every latitude band the square reaches into. """
+
+    column_letter = COLUMN_LETTERS[(zone - 1) % 3][column - 1]
+    # the row letters repeat every 2000 km and are shifted by five in even zones
+    row_letter = ROW_LETTERS[(row + (5 if zone % 2 == 0 else 0)) % len(ROW_LETTERS)]
+
+    _, min_lat, _, max_lat = project(
+        square.segmentize(SQUARE_SIZE / 10), get_transformer(zone, south), direction='INVERSE'
+    ).bounds
+
+    return [f'{zone:02d}{band}{column_letter}{row_letter}' for band in get_bands(min_lat, max_lat)]
+
+
+def get_bands(min_lat, max_lat):
+    """ Get the letters of the latitude bands in a latitude range. """
+
+    # squares that end exactly on a band boundary (like the equator) don't reach into the next band
+    epsilon = 1e-6
+
+    first = max(0, min(len(BAND_LETTERS) - 1, math.floor((min_lat + epsilon + 80) / 8)))
+    last = max(0, min(len(BAND_LETTERS) - 1, math.floor((max_lat - epsilon + 80) / 8)))
+
+    return BAND_LETTERS[first:last + 1]
+
+
+def get_zone(lon):
+    """ Get the number of the UTM zone a longitude is in. """
+
+    return int((lon + 180) // 6) + 1
+
+
+@functools.lru_cache(maxsize=None)
+def get_zone_strip(zone, south):
+    """ Get the area of a zone in its own projected coordinates. """
+
+    west = (zone - 1) * 6 - 180
+    strip = shapely.box(west, -80, west + 6, 0) if south else shapely.box(west, 0, west + 6, 84)
+
+    return project(strip.segmentize(0.5), get_transformer(zone, south))
+
+
+def project(geometry, transformer, direction='FORWARD'):
+    """ Transform all coordinates of a geometry at once with a pyproj transformer. """
+
+    return shapely.transform(
+        geometry, lambda coords: numpy.column_stack(transformer.transform(*coords.T, direction=direction))
+    )
+
+
+@functools.lru_cache(maxsize=None)
+def get_transformer(zone, south):
+    """ Get the transformer from geographic coordinates to the UTM zone. """
+
+    epsg = (32700 if south else 32600) + zone
+
+    return pyproj.Transformer.from_crs('EPSG:4326', f'EPSG:{epsg}', always_xy=True)
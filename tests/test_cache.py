@@ -0,0 +1,91 @@
+import os
+import types
+
+import pytest
+
+import searching.cache as cache
+import configuration.paths as paths
+
+
+@pytest.fixture
+def clock(tmp_path, monkeypatch):
+    """ A cache in a temporary directory, with a clock that only moves when the test moves it. """
+
+    now = [1_000_000.0]
+
+    monkeypatch.setattr(paths, 'search_cache', tmp_path / 'sdm-search-cache.sqlite3')
+    monkeypatch.setattr(cache, 'time', types.SimpleNamespace(time=lambda: now[0]))
+
+    return now
+
+
+def set_settings(monkeypatch, ttl=3600, max_size=1024 * 1024):
+    monkeypatch.setattr(cache, 'get_settings', lambda: (ttl, max_size))
+
+
+def test_key_ignores_whitespace():
+    assert cache.get_key('platformname:Sentinel-2  AND\n cloudcover', 0, 100) == cache.get_key(
+        ' platformname:Sentinel-2 AND cloudcover ', 0, 100
+    )
+
+
+@pytest.mark.parametrize('other', [
+    ('platformname:Sentinel-1', 0, 100, False),
+    ('platformname:Sentinel-2', 100, 100, False),
+    ('platformname:Sentinel-2', 0, 50, False),
+    ('platformname:Sentinel-2', 0, 100, True),
+])
+def test_key_tells_requests_apart(other):
+    query, start, rows, eumetsat = other
+
+    assert cache.get_key('platformname:Sentinel-2', 0, 100) != cache.get_key(query, start, rows, eumetsat=eumetsat)
+
+
+def test_responses_expire(clock, monkeypatch):
+    set_settings(monkeypatch, ttl=3600)
+    cache.put('key', b'<feed/>')
+
+    clock[0] += 3599
+    assert cache.get('key') == b'<feed/>'
+
+    clock[0] += 2
+    assert cache.get('key') is None
+
+
+def test_expired_responses_are_deleted(clock, monkeypatch):
+    set_settings(monkeypatch, ttl=3600)
+    cache.put('old', b'<feed/>')
+
+    clock[0] += 3601
+    cache.put('new', b'<feed/>')
+
+    with cache.connect() as connection:
+        assert [row[0] for row in connection.execute('SELECT key FROM responses;')] == ['new']
+
+
+def test_least_recently_used_responses_are_evicted(clock, monkeypatch):
+    # random bytes don't compress, so every response takes about 1000 bytes
+    set_settings(monkeypatch, max_size=3500)
+    responses = {key: os.urandom(1000) for key in ['a', 'b', 'c', 'd']}
+
+    for key in ['a', 'b', 'c']:
+        clock[0] += 1
+        cache.put(key, responses[key])
+
+    # reading a response makes it the most recently used one
+    clock[0] += 1
+    assert cache.get('a') == responses['a']
+
+    clock[0] += 1
+    cache.put('d', responses['d'])
+
+    assert cache.get('b') is None
+    assert [cache.get(key) for key in ['a', 'c', 'd']] == [responses[key] for key in ['a', 'c', 'd']]
+
+
+def test_put_replaces_response(clock, monkeypatch):
+    set_settings(monkeypatch)
+    cache.put('key', b'truncated')
+    cache.put('key', b'<feed/>')
+
+    assert cache.get('key') == b'<feed/>'
@@ -0,0 +1,127 @@
+import sqlite3
+
+import pytest
+
+import configuration.paths as paths
+import configuration.database as database
+
+FOOTPRINTS = {
+    'a': 'POLYGON ((30 59, 31 59, 31 60, 30 60, 30 59))',
+    'b': 'POLYGON ((-75 40, -73 40, -73 41, -75 41, -75 40))',
+    'c': None,
+    'd': 'POLYGON ((150 -34, 152 -34, 152 -33, 150 -33, 150 -34))',
+    'e': 'POLYGON ((-44 -23, -43 -23, -43 -22, -44 -22, -44 -23))',
+}
+
+
+@pytest.fixture
+def database_file(tmp_path, monkeypatch):
+    monkeypatch.setattr(paths, 'database', tmp_path / 'sdm-metadata.sqlite3')
+
+    return paths.database
+
+
+def create_baseline_database(file):
+    """ Create the database the way the first release did, with a gap in the rowids. """
+
+    with sqlite3.connect(file) as connection:
+        connection.execute(
+            'CREATE TABLE metadata('
+            'product_id TEXT PRIMARY KEY,'
+            'title TEXT UNIQUE,'
+            'footprint_wkt TEXT,'
+            'file_size INTEGER,'
+            'eumetsat BOOLEAN,'
+            'status TEXT'
+            ');'
+        )
+        connection.executemany(
+            'INSERT INTO metadata VALUES (?, ?, ?, ?, ?, ?);',
+            [(id_, f'P{id_}', wkt, 1000, False, 'found') for id_, wkt in FOOTPRINTS.items()]
+        )
+        connection.execute('DELETE FROM metadata WHERE product_id = ?;', ('b',))
+
+        return dict(connection.execute('SELECT product_id, rowid FROM metadata;').fetchall())
+
+
+def get_version(file):
+    with sqlite3.connect(file) as connection:
+        return connection.execute('PRAGMA user_version;').fetchone()[0]
+
+
+def test_new_database_is_current(database_file):
+    database.generate_metadata_database()
+
+    assert get_version(database_file) == len(database.MIGRATIONS) == 3
+
+
+def test_baseline_database_is_migrated(database_file):
+    rowids = create_baseline_database(database_file)
+
+    database.migrate_metadata_database()
+
+    with sqlite3.connect(database_file) as connection:
+        columns = [row[1] for row in connection.execute('PRAGMA table_info(metadata);')]
+        ids = dict(connection.execute('SELECT product_id, id FROM metadata;').fetchall())
+        titles = dict(connection.execute('SELECT product_id, title FROM metadata;').fetchall())
+        indexed = {row[0] for row in connection.execute('SELECT id FROM footprint_index;')}
+
+    assert get_version(database_file) == 3
+    assert columns == [*database.ORIGINAL_COLUMNS, *database.METADATA_COLUMNS, 'id']
+    assert ids == rowids
+    assert titles == {id_: f'P{id_}' for id_ in rowids}
+    assert indexed == {rowids['a'], rowids['d'], rowids['e']}
+
+
+def test_version_2_database_keeps_its_ids_and_index(database_file):
+    create_baseline_database(database_file)
+
+    with sqlite3.connect(database_file) as connection:
+        cursor = connection.cursor()
+
+        for number, migration in enumerate(database.MIGRATIONS[:2], 1):
+            migration(cursor)
+            cursor.execute(f'PRAGMA user_version = {number};')
+
+        # version 2 indexed the footprints by rowid
+        rows = cursor.execute('SELECT rowid, footprint_wkt FROM metadata WHERE footprint_wkt IS NOT NULL;').fetchall()
+        cursor.executemany(
+            'INSERT INTO footprint_index VALUES (?, ?, ?, ?, ?);',
+            [(rowid, *database.get_bounding_box(wkt)) for rowid, wkt in rows]
+        )
+        index = set(cursor.execute('SELECT * FROM footprint_index;').fetchall())
+
+    database.migrate_metadata_database()
+
+    with sqlite3.connect(database_file) as connection:
+        assert set(connection.execute('SELECT * FROM footprint_index;').fetchall()) == index
+
+    assert get_version(database_file) == 3
+    assert database.find_by_bounding_box(29, 58, 32, 61) == ['a']
+    assert sorted(database.find_by_bounding_box(-180, -90, 180, 0)) == ['d', 'e']
+
+
+def test_index_survives_vacuum(database_file):
+    create_baseline_database(database_file)
+    database.migrate_metadata_database()
+
+    with sqlite3.connect(database_file) as connection:
+        connection.execute('DELETE FROM metadata WHERE product_id = ?;', ('a',))
+        connection.execute('DELETE FROM footprint_index WHERE id NOT IN (SELECT id FROM metadata);')
+
+    with sqlite3.connect(database_file) as connection:
+        connection.execute('VACUUM;')
+
+    assert database.find_by_bounding_box(-45, -24, -42, -21) == ['e']
+    assert database.find_by_bounding_box(149, -35, 153, -32) == ['d']
+
+
+def test_migration_runs_once(database_file):
+    database.generate_metadata_database()
+
+    with sqlite3.connect(database_file) as connection:
+        connection.execute("INSERT INTO metadata(product_id, title) VALUES ('a', 'Pa');")
+
+    database.migrate_metadata_database()
+
+    assert database.get_product('a')['title'] == 'Pa'
@@ -0,0 +1,174 @@
+import pytest
+
+import configuration.feeds as feeds
+import configuration.exceptions as exceptions
+
+SEARCH_PAGE = b'''<?xml version="1.0" encoding="utf-8"?>
+<feed xmlns:opensearch="http://a9.com/-/spec/opensearch/1.1/" xmlns="http://www.w3.org/2005/Atom">
+<title>Sentinels Scientific Data Hub search results for: platformname:Sentinel-2</title>
+<opensearch:totalResults>1234</opensearch:totalResults>
+<opensearch:startIndex>0</opensearch:startIndex>
+<opensearch:itemsPerPage>100</opensearch:itemsPerPage>
+<entry>
+<title>S2A_MSIL1C_20210601T093041_N0300_R136_T35VPG_20210601T103019</title>
+<id>2b17b57d-fff4-4645-b539-91f305c27c69</id>
+<date name="ingestiondate">2021-06-01T12:39:55.251Z</date>
+<date name="beginposition">2021-06-01T09:30:41.024Z</date>
+<date name="endposition">2021-06-01T09:30:41.024Z</date>
+<double name="cloudcoverpercentage">12.5</double>
+<str name="footprint">MULTIPOLYGON (((30 59, 31 59, 31 60, 30 60, 30 59)))</str>
+<str name="platformname">Sentinel-2</str>
+<str name="producttype">S2MSI1C</str>
+<str name="size">1.05 GB</str>
+<bool name="online">true</bool>
+</entry>
+<entry>
+<title>S2B_MSIL1C_20190601T093049_N0207_R136_T35VPG_20190601T113023</title>
+<id>5cb7e4f5-7c21-4d1e-9bb4-3ac1b8a2a1c0</id>
+<str name="size">800 MB</str>
+<bool name="online">false</bool>
+</entry>
+</feed>
+'''
+
+EUMETSAT_PAGE = b'''<?xml version="1.0" encoding="utf-8"?>
+<feed xmlns:opensearch="http://a9.com/-/spec/opensearch/1.1/" xmlns="http://www.w3.org/2005/Atom">
+<opensearch:totalResults>1</opensearch:totalResults>
+<entry>
+<title>S3A_OL_1_EFR____20210601T081807_20210601T082107_20210602T124442_0179_072_335_1800_MAR_O_NT_002</title>
+<id>f7a2e0e9-57a2-4a8b-8a55-2f1e0d2b6a3d</id>
+<str name="platformname">Sentinel-3</str>
+<str name="size">719.13 MB</str>
+</entry>
+</feed>
+'''
+
+ODATA_ENTRY = b'''<?xml version="1.0" encoding="utf-8"?>
+<entry xmlns="http://www.w3.org/2005/Atom"
+       xmlns:m="http://schemas.microsoft.com/ado/2007/08/dataservices/metadata"
+       xmlns:d="http://schemas.microsoft.com/ado/2007/08/dataservices">
+<m:properties>
+<d:Id>2b17b57d-fff4-4645-b539-91f305c27c69</d:Id>
+<d:Name>S2A_MSIL1C_20210601T093041_N0300_R136_T35VPG_20210601T103019</d:Name>
+<d:ContentLength>1127478301</d:ContentLength>
+<d:IngestionDate>2021-06-01T12:39:55.251</d:IngestionDate>
+<d:ContentDate m:type="DHusIntegration.TimeRange">
+<d:Start>2021-06-01T09:30:41.024</d:Start>
+<d:End>2021-06-01T09:30:41.024</d:End>
+</d:ContentDate>
+<d:Checksum m:type="DHusIntegration.Checksum">
+<d:Algorithm>MD5</d:Algorithm>
+<d:Value>A76CFCE99A5EB95ECB55D0C102B738C9</d:Value>
+</d:Checksum>
+<d:ContentGeometry>&lt;gml:Polygon&gt;&lt;gml:outerBoundaryIs&gt;&lt;gml:LinearRing&gt;
+&lt;gml:coordinates&gt;59,30 59,31 60,31 59,30&lt;/gml:coordinates&gt;
+&lt;/gml:LinearRing&gt;&lt;/gml:outerBoundaryIs&gt;&lt;/gml:Polygon&gt;</d:ContentGeometry>
+<d:Online>false</d:Online>
+</m:properties>
+</entry>
+'''
+
+
+def chunked(content, size):
+    """ Split a body into chunks the way a streamed response delivers it. """
+
+    return [content[i:i + size] for i in range(0, len(content), size)]
+
+
+@pytest.mark.parametrize('size', [7, 64, len(SEARCH_PAGE)])
+def test_search_page(size):
+    total_results, entries = feeds.parse_search_feed(chunked(SEARCH_PAGE, size))
+    first, second = list(entries)
+
+    assert total_results == 1234
+    assert first == {
+        'product_id': '2b17b57d-fff4-4645-b539-91f305c27c69',
+        'title': 'S2A_MSIL1C_20210601T093041_N0300_R136_T35VPG_20210601T103019',
+        'footprint_wkt': 'MULTIPOLYGON (((30 59, 31 59, 31 60, 30 60, 30 59)))',
+        'file_size': round(1.05 * 1024 ** 3),
+        'platform': 'Sentinel-2',
+        'product_type': 'S2MSI1C',
+        'sensing_start': '2021-06-01T09:30:41.024Z',
+        'sensing_end': '2021-06-01T09:30:41.024Z',
+        'ingestion_date': '2021-06-01T12:39:55.251Z',
+        'cloud_cover': 12.5,
+        'status': 'online',
+    }
+    assert second['status'] == 'offline'
+    assert second['file_size'] == 800 * 1024 ** 2
+    assert second['cloud_cover'] is None
+
+
+def test_eumetsat_entries_have_no_online_status():
+    total_results, entries = feeds.parse_search_feed([EUMETSAT_PAGE])
+    entry, = entries
+
+    assert total_results == 1
+    assert entry['status'] == 'found'
+    assert entry['platform'] == 'Sentinel-3'
+
+
+def test_page_without_total_results():
+    page = SEARCH_PAGE.replace(b'<opensearch:totalResults>1234</opensearch:totalResults>', b'')
+    total_results, entries = feeds.parse_search_feed([page])
+
+    assert total_results == 0
+    assert len(list(entries)) == 2
+
+
+def test_empty_page():
+    page = SEARCH_PAGE[:SEARCH_PAGE.index(b'<entry>')] + b'</feed>'
+    page = page.replace(b'>1234<', b'>0<')
+    total_results, entries = feeds.parse_search_feed([page])
+
+    assert total_results == 0
+    assert list(entries) == []
+
+
+@pytest.mark.parametrize('body', [
+    b'',
+    b'<html><head><title>502 Bad Gateway</title></head><body><hr></body></html>',
+    b'Unauthorized',
+    SEARCH_PAGE[:len(SEARCH_PAGE) // 2],
+    SEARCH_PAGE.replace(b'>1234<', b'>many<'),
+])
+def test_malformed_search_page(body):
+    with pytest.raises(exceptions.MalformedFeedError):
+        total_results, entries = feeds.parse_search_feed(chunked(body, 64))
+        list(entries)
+
+
+def test_odata_entry():
+    entry, = feeds.iter_odata_entries(chunked(ODATA_ENTRY, 100))
+
+    assert entry == {
+        'product_id': '2b17b57d-fff4-4645-b539-91f305c27c69',
+        'title': 'S2A_MSIL1C_20210601T093041_N0300_R136_T35VPG_20210601T103019',
+        'footprint_wkt': 'Polygon((30 59,31 59,31 60,30 59))',
+        'file_size': 1127478301,
+        'status': 'offline',
+        'sensing_start': '2021-06-01T09:30:41.024Z',
+        'sensing_end': '2021-06-01T09:30:41.024Z',
+        'ingestion_date': '2021-06-01T12:39:55.251Z',
+        'checksum': 'a76cfce99a5eb95ecb55d0c102b738c9',
+    }
+
+
+def test_odata_feed():
+    entry = ODATA_ENTRY[ODATA_ENTRY.index(b'<m:properties>'):ODATA_ENTRY.index(b'</entry>')]
+    feed = (
+        b'<feed xmlns="http://www.w3.org/2005/Atom" '
+        b'xmlns:m="http://schemas.microsoft.com/ado/2007/08/dataservices/metadata" '
+        b'xmlns:d="http://schemas.microsoft.com/ado/2007/08/dataservices"><title>Products</title>'
+        + b''.join(b'<entry>' + entry.replace(b'2b17b57d', f'{i:08x}'.encode()) + b'</entry>' for i in range(3))
+        + b'</feed>'
+    )
+
+    assert [entry['product_id'][:8] for entry in feeds.iter_odata_entries(chunked(feed, 256))] == [
+        '00000000', '00000001', '00000002'
+    ]
+
+
+def test_malformed_odata_entry():
+    with pytest.raises(exceptions.MalformedFeedError):
+        list(feeds.iter_odata_entries([ODATA_ENTRY[:-100]]))
@@ -0,0 +1,108 @@
+import datetime
+import threading
+
+import pytest
+
+import searching.planner as planner
+import configuration.config as config
+
+PRODUCTS_PER_DAY = 50
+
+
+@pytest.fixture
+def hub(monkeypatch):
+    """ A hub with PRODUCTS_PER_DAY products every day, which records the pages it is asked for. """
+
+    requests = []
+    lock = threading.Lock()
+
+    def fetch_search_page(query, start, eumetsat=False, use_cache=True, refresh_cache=False):
+        start_date, end_date, since = query
+        days = (end_date - start_date).days + 1
+        products = [
+            f'{start_date + datetime.timedelta(days=day)}/{n}'
+            for day in range(days) for n in range(PRODUCTS_PER_DAY)
+        ]
+
+        with lock:
+            requests.append({'query': query, 'start': start, 'use_cache': use_cache})
+
+        entries = [{'product_id': product_id} for product_id in products[start:start + planner.api.ROWS_PER_PAGE]]
+
+        return entries, len(products)
+
+    monkeypatch.setattr(config, 'get_hub_connections', lambda eumetsat=False: 4)
+    monkeypatch.setattr(planner, 'get_shard_query', lambda shard: (
+        shard['start_date'], shard['end_date'], shard['since']
+    ))
+    monkeypatch.setattr(planner.api, 'fetch_search_page', fetch_search_page)
+
+    return requests
+
+
+def make_shard(days, since=None):
+    start_date = datetime.date(2021, 1, 1)
+
+    return {
+        'mission': 'Sentinel-2',
+        'eumetsat': False,
+        'start_date': start_date,
+        'end_date': start_date + datetime.timedelta(days=days - 1),
+        'key': 'query',
+        'since': since,
+        'roi': None,
+        'tiles': None,
+        'filter': False,
+    }
+
+
+def execute(shards, **kwargs):
+    results = {}
+    progress = list(planner.execute_plan(shards, results, **kwargs))
+
+    return results, progress
+
+
+def test_small_shard_is_paged(hub):
+    results, progress = execute([make_shard(days=10)])
+
+    assert len(results[('query', False)]) == 10 * PRODUCTS_PER_DAY
+    assert sorted(request['start'] for request in hub) == list(range(0, 10 * PRODUCTS_PER_DAY, 100))
+    assert progress[-1] == (5, 5)
+
+
+def test_large_shard_is_split_in_time(hub):
+    results, progress = execute([make_shard(days=100)])
+
+    assert len(results[('query', False)]) == 100 * PRODUCTS_PER_DAY
+    assert max(request['start'] for request in hub) < planner.MAX_SHARD_RESULTS
+
+    # 100 days are split into halves of 50, and those into quarters of 25 days with 1250 products each
+    queries = {request['query'] for request in hub if request['start'] > 0}
+    assert sorted((end - start).days + 1 for start, end, _ in queries) == [25, 25, 25, 25]
+    assert progress[-1][0] == progress[-1][1] == len(hub)
+
+
+def test_single_day_shard_is_not_split(hub, monkeypatch):
+    monkeypatch.setattr(planner, 'MAX_SHARD_RESULTS', PRODUCTS_PER_DAY // 2)
+
+    results, _ = execute([make_shard(days=1)])
+
+    assert len(results[('query', False)]) == PRODUCTS_PER_DAY
+    assert len(hub) == 1
+
+
+def test_split_shard_covers_the_date_range():
+    shard = make_shard(days=31)
+    first, second = planner.split_shard(shard)
+
+    assert first['start_date'] == shard['start_date']
+    assert first['end_date'] + datetime.timedelta(days=1) == second['start_date']
+    assert second['end_date'] == shard['end_date']
+
+
+def test_incremental_shards_bypass_the_cache(hub):
+    execute([make_shard(days=10), dict(make_shard(days=10), key='other', since='2021-01-05T00:00:00.000Z')])
+
+    assert {request['use_cache'] for request in hub if request['query'][2] is None} == {True}
+    assert {request['use_cache'] for request in hub if request['query'][2] is not None} == {False}
@@ -0,0 +1,73 @@
+import io
+import types
+import zipfile
+
+import pytest
+import urllib3
+
+import fetching.remote_zip as remote_zip
+import configuration.sessions as sessions
+
+
+@pytest.fixture
+def remote(monkeypatch):
+    """ Serve the Range requests of a `RemoteFile` from bytes, cutting every response to at most `limit` bytes. """
+
+    def serve(data, limit=None):
+        def get(url, eumetsat=False, headers=None, stream=False):
+            start, end = map(int, headers['Range'][len('bytes='):].split('-'))
+            content = data[start:end + 1][:limit]
+
+            return types.SimpleNamespace(
+                status_code=206, content=content, raw=io.BytesIO(content), close=lambda: None
+            )
+
+        monkeypatch.setattr(sessions, 'get_settings', lambda eumetsat=False: {'retries': 1})
+        monkeypatch.setattr(sessions, 'get', get)
+
+        return remote_zip.RemoteFile('https://hub/$value', len(data))
+
+    return serve
+
+
+def test_reads_whole_file(remote):
+    data = bytes(range(256)) * 10_000
+    remote_file = remote(data)
+
+    assert remote_file.read() == data
+
+
+def test_reads_archive_members(remote, tmp_path):
+    archive = io.BytesIO()
+
+    with zipfile.ZipFile(archive, 'w') as f:
+        f.writestr('S2A/GRANULE/IMG_DATA/T35VPG_B04_10m.jp2', b'B04' * 1000)
+        f.writestr('S2A/MTD_MSIL1C.xml', b'<xml/>')
+
+    with zipfile.ZipFile(remote(archive.getvalue())) as f:
+        members = list(remote_zip.extract_members(f, ['*_B04_10m.jp2'], tmp_path))
+
+    assert [info.filename for info in members] == ['S2A/GRANULE/IMG_DATA/T35VPG_B04_10m.jp2']
+    assert (tmp_path / members[0].filename).read_bytes() == b'B04' * 1000
+
+
+@pytest.mark.parametrize('limit', [0, 100])
+def test_short_tail_raises(remote, limit):
+    remote_file = remote(b'x' * 1000, limit=limit)
+    remote_file.seek(-10, io.SEEK_END)
+
+    with pytest.raises(urllib3.exceptions.ProtocolError):
+        remote_file.read()
+
+
+def test_empty_stream_raises(remote):
+    remote_file = remote(b'x' * (remote_zip.TAIL_SIZE + 1000), limit=0)
+
+    with pytest.raises(urllib3.exceptions.ProtocolError):
+        remote_file.read(1000)
+
+
+def test_short_stream_resumes(remote):
+    remote_file = remote(b'x' * (remote_zip.TAIL_SIZE + 1000), limit=100)
+
+    assert remote_file.read(1000) == b'x' * 1000
@@ -0,0 +1,46 @@
+import pytest
+import shapely
+import shapely.wkt
+
+import searching.roi as roi
+import configuration.config as config
+
+
+@pytest.fixture
+def roi_wkt(monkeypatch):
+    """ Compile the ROI from the given WKT without a configuration file. """
+
+    def set_roi(wkt, tolerance=0):
+        monkeypatch.setattr(config, 'get_derived', lambda key, function: function())
+        monkeypatch.setattr(config, 'get_roi', lambda: wkt)
+        monkeypatch.setattr(roi, 'get_settings', lambda: (tolerance, 'none', roi.DEFAULT_MAX_VERTICES))
+
+    return set_roi
+
+
+@pytest.mark.parametrize('wkt', [
+    'POLYGON ((0 0, 2 0, 2 2, 0 2, 0 0, -1 -1, 0 0))',
+    'POLYGON ((0 0, 4 0, 4 4, 0 4, 0 0, 2 2, 0 0))',
+    'MULTIPOLYGON (((0 0, 2 0, 2 2, 0 2, 0 0, -1 -1, 0 0)), ((5 5, 6 5, 6 6, 5 6, 5 5)))',
+])
+def test_repaired_roi_keeps_only_polygons(roi_wkt, wkt):
+    roi_wkt(wkt)
+
+    pieces = [shapely.wkt.loads(piece) for piece in roi.compile_roi()]
+
+    assert all(piece.geom_type in ['Polygon', 'MultiPolygon'] for piece in pieces)
+    assert shapely.union_all(pieces).equals(roi.get_roi_geometry())
+
+
+def test_bowtie_roi_becomes_two_triangles(roi_wkt):
+    roi_wkt('POLYGON ((0 0, 2 2, 2 0, 0 2, 0 0))')
+
+    assert roi.get_roi_geometry().geom_type == 'MultiPolygon'
+    assert roi.get_roi_geometry().area == pytest.approx(2)
+
+
+def test_roi_without_area_is_rejected(roi_wkt):
+    roi_wkt('POLYGON ((0 0, 1 1, 2 2, 0 0))')
+
+    with pytest.raises(ValueError):
+        roi.get_roi_geometry()
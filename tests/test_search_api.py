@@ -0,0 +1,115 @@
+import pytest
+
+import searching.cache as cache
+import searching.search_api as search_api
+import configuration.paths as paths
+import configuration.database as database
+import configuration.exceptions as exceptions
+
+PAGE = (
+    b'<feed xmlns="http://www.w3.org/2005/Atom" xmlns:opensearch="http://a9.com/-/spec/opensearch/1.1/">'
+    b'<opensearch:totalResults>1</opensearch:totalResults>'
+    b'<entry><id>a</id><title>Pa</title><bool name="online">true</bool></entry>'
+    b'</feed>'
+)
+
+
+class Response:
+    """ A streamed response that remembers if it was closed. """
+
+    def __init__(self, status_code, content):
+        self.status_code = status_code
+        self.reason = 'Reason'
+        self.content = content
+        self.closed = False
+
+    def iter_content(self, chunk_size):
+        return (self.content[i:i + chunk_size] for i in range(0, len(self.content), chunk_size))
+
+    def close(self):
+        self.closed = True
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+@pytest.fixture
+def hub(tmp_path, monkeypatch):
+    """ Answer every search with the responses in the list, in turn. """
+
+    responses = []
+
+    monkeypatch.setattr(paths, 'search_cache', tmp_path / 'sdm-search-cache.sqlite3')
+    monkeypatch.setattr(paths, 'database', tmp_path / 'sdm-metadata.sqlite3')
+    monkeypatch.setattr(cache, 'get_settings', lambda: (3600, 1024 * 1024))
+    monkeypatch.setattr(search_api, 'execute_search_query', lambda *args, **kwargs: responses.pop(0))
+
+    return responses
+
+
+def test_page_is_cached(hub):
+    hub.append(Response(200, PAGE))
+
+    first = search_api.fetch_search_page('query', 0)
+    # the hub has no second response, so the second page comes from the cache
+    second = search_api.fetch_search_page('query', 0)
+
+    assert first == second
+    assert [entry['product_id'] for entry in first[0]] == ['a']
+
+
+def test_damaged_cached_page_is_fetched_again(hub):
+    cache.put(cache.get_key('query', 0, search_api.ROWS_PER_PAGE), PAGE[:len(PAGE) // 2])
+    hub.append(Response(200, PAGE))
+
+    entries, total_results = search_api.fetch_search_page('query', 0)
+
+    assert (len(entries), total_results) == (1, 1)
+    assert cache.get(cache.get_key('query', 0, search_api.ROWS_PER_PAGE)) == PAGE
+
+
+@pytest.mark.parametrize('use_cache', [True, False])
+def test_failed_page_is_closed(hub, use_cache):
+    response = Response(503, b'<html><body>Service Unavailable</body></html>')
+    hub.append(response)
+
+    with pytest.raises(exceptions.FailedRequestError):
+        search_api.fetch_search_page('query', 0, use_cache=use_cache)
+
+    assert response.closed
+
+
+@pytest.mark.parametrize('use_cache', [True, False])
+def test_malformed_page_is_closed_and_not_cached(hub, use_cache):
+    response = Response(200, b'<html><body>Maintenance</body></html')
+    hub.append(response)
+
+    with pytest.raises(exceptions.MalformedFeedError):
+        search_api.fetch_search_page('query', 0, use_cache=use_cache)
+
+    assert response.closed
+    assert cache.get(cache.get_key('query', 0, search_api.ROWS_PER_PAGE)) is None
+
+
+@pytest.mark.parametrize('status_code, content', [(401, b''), (500, b'<html>Internal Server Error</html>')])
+def test_failed_name_search_raises(hub, status_code, content):
+    database.generate_metadata_database()
+    response = Response(status_code, content)
+    hub.append(response)
+
+    with pytest.raises(exceptions.FailedRequestError):
+        search_api.find_product_by_name('Pa')
+
+    assert response.closed
+
+
+def test_name_search_saves_the_product(hub):
+    database.generate_metadata_database()
+    hub.append(Response(200, PAGE))
+
+    assert search_api.find_product_by_name('Pa')[:2] == ('a', 'Pa')
+    # found in the database the second time
+    assert search_api.find_product_by_name('Pa')[:2] == ('a', 'Pa')
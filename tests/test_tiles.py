@@ -0,0 +1,42 @@
+import pytest
+import shapely
+
+import searching.tiles as tiles
+
+
+def around(lon, lat, size=1e-4):
+    """ Get a small square around a point, tiles that only touch a geometry don't count. """
+
+    return shapely.box(lon - size, lat - size, lon + size, lat + size)
+
+
+@pytest.mark.parametrize('lon, lat, expected', [
+    (2.35, 48.85, ['31UDQ']),  # Paris
+    (-74.0, 40.7, ['18TWL']),  # New York
+    (151.2, -33.87, ['56HLH']),  # Sydney
+    (-43.2, -22.9, ['23KPQ']),  # Rio de Janeiro
+])
+def test_tile_of_known_point(lon, lat, expected):
+    assert tiles.find_tiles(around(lon, lat)) == expected
+
+
+@pytest.mark.parametrize('lon', [29.99, 30.01, 30.3])
+def test_tiles_overlap_across_zone_edge(lon):
+    # Saint Petersburg, the tiles of zones 35 and 36 overlap across the 30°E meridian
+    assert tiles.find_tiles(around(lon, 59.9)) == ['35VPG', '36VUM']
+
+
+@pytest.mark.parametrize('min_lat, max_lat, expected', [
+    (48.0, 49.0, 'U'),
+    (55.5, 56.5, 'UV'),
+    (-1.0, 0.0, 'M'),
+    (0.0, 1.0, 'N'),
+    (75.0, 83.0, 'X'),
+])
+def test_latitude_bands(min_lat, max_lat, expected):
+    assert tiles.get_bands(min_lat, max_lat) == expected
+
+
+@pytest.mark.parametrize('lon, zone', [(-180, 1), (-174.01, 1), (-174, 2), (2.35, 31), (30, 36), (179.99, 60)])
+def test_zone_of_longitude(lon, zone):
+    assert tiles.get_zone(lon) == zone
@@ -0,0 +1,3 @@
+""" This package contains code for watching offline products until they can be downloaded. """
+
+from watching.watch import watch
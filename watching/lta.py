@@ -0,0 +1,178 @@
+""" Request offline products from the Long Term Archive (LTA) and keep track of the requests. """
+
+import sqlite3
+import datetime
+
+import urllib3
+import requests
+
+import fetching.queue as queue
+import fetching.data_api as data_api
+import configuration.urls as urls
+import configuration.paths as paths
+import configuration.config as config
+import configuration.sessions as sessions
+
+DEFAULT_QUOTA = 20
+DEFAULT_MIN_INTERVAL = 1  # minutes
+DEFAULT_MAX_INTERVAL = 30  # minutes
+
+# the hub forgets retrieval requests that don't complete, so older requests are sent again
+REQUEST_EXPIRY = datetime.timedelta(hours=24)
+
+
+def get_quota(eumetsat=False):
+    """ Get the number of products a user can request from the hub's LTA at a time. """
+
+    return config.get_hub_params(eumetsat=eumetsat).get('LTA quota', DEFAULT_QUOTA)
+
+
+def get_intervals():
+    """ Get the shortest and the longest time between checks, in seconds. """
+
+    params = config.get_config().get('Watch') or {}
+
+    min_interval = params.get('Min interval minutes', DEFAULT_MIN_INTERVAL) * 60
+    max_interval = params.get('Max interval minutes', DEFAULT_MAX_INTERVAL) * 60
+
+    return min_interval, max(min_interval, max_interval)
+
+
+def get_next_interval(interval, changed):
+    """ Back off while nothing changes, check often again as soon as something does. """
+
+    min_interval, max_interval = get_intervals()
+
+    return min_interval if changed else min(interval * 2, max_interval)
+
+
+def get_watched(eumetsat=False):
+    """ Get the queued products of a hub that are not online.
+
+     Returns:
+         list of dict: The rows of the metadata table, in the order of the download queue.
+
+    """
+
+    with sqlite3.connect(paths.database) as connection:
+        connection.row_factory = sqlite3.Row
+        cursor = connection.cursor()
+        cursor.execute(
+            'SELECT * FROM metadata WHERE download_state = ? AND eumetsat = ? AND status IN ("offline", "requested") '
+            'ORDER BY download_priority;',
+            (queue.QUEUED, int(eumetsat))
+        )
+        result = [dict(row) for row in cursor.fetchall()]
+
+    return result
+
+
+def get_products_to_request(watched, eumetsat=False):
+    """ Choose the watched products to request now, within the hub's quota.
+
+     Notes:
+         Products requested longer than REQUEST_EXPIRY ago are requested again, they still count against the quota
+         until then.
+
+    """
+
+    expired = (datetime.datetime.now(datetime.timezone.utc) - REQUEST_EXPIRY).isoformat()
+
+    active = [
+        product for product in watched
+        if product['status'] == 'requested' and (product['lta_requested_at'] or '') > expired
+    ]
+    waiting = [product for product in watched if product not in active]
+
+    return waiting[:max(get_quota(eumetsat=eumetsat) - len(active), 0)]
+
+
+def request_retrieval(product):
+    """ Ask the hub to bring an offline product back from the LTA.
+
+     Returns:
+         str: The new status of the product: 'requested', or 'online' if it already is. None if the hub refused
+         the request, usually because the user's quota is used up.
+
+    Notes:
+         Getting the product's data triggers the retrieval. The response of an online product is closed
+         without reading the data.
+
+    """
+
+    eumetsat = bool(product['eumetsat'])
+    url = urls.get_product_url(product['product_id'], eumetsat=eumetsat) + '$value'
+
+    try:
+        with sessions.get(url, eumetsat=eumetsat, stream=True) as request:
+            status_code = request.status_code
+    except (requests.RequestException, urllib3.exceptions.HTTPError):
+        return None
+
+    if status_code == 202:
+        return 'requested'
+
+    if status_code in [200, 206]:
+        return 'online'
+
+    return None
+
+
+def save_request(id_, status):
+    """ Record the outcome of a retrieval request. """
+
+    with sqlite3.connect(paths.database) as connection:
+        cursor = connection.cursor()
+        cursor.execute(
+            'UPDATE metadata SET status = ?, lta_requested_at = ? WHERE product_id = ?;',
+            (status, datetime.datetime.now(datetime.timezone.utc).isoformat() if status == 'requested' else None, id_)
+        )
+
+
+def request_products(eumetsat=False):
+    """ Request the watched products of a hub from the LTA, as many as the quota allows.
+
+     Returns:
+         requested, online: The number of products requested, and the number that turned out to be online.
+
+    Notes:
+         Requests stop at the first one the hub refuses.
+
+    """
+
+    requested, online = 0, 0
+
+    for product in get_products_to_request(get_watched(eumetsat=eumetsat), eumetsat=eumetsat):
+        status = request_retrieval(product)
+
+        if status is None:
+            break
+
+        save_request(product['product_id'], status)
+        requested += status == 'requested'
+        online += status == 'online'
+
+    return requested, online
+
+
+def poll(eumetsat=False):
+    """ Refresh the metadata of all queued products of a hub, in batches.
+
+     Returns:
+         int: The number of watched products that came online.
+
+    Notes:
+         The online products are refreshed as well, the search results only have approximate sizes.
+
+    """
+
+    watched = len(get_watched(eumetsat=eumetsat))
+    ids = queue.get_queued_ids(eumetsat=eumetsat)
+
+    if not ids:
+        return 0
+
+    for _ in data_api.fetch_metadata_by_ids(ids, eumetsat=eumetsat):
+        pass
+
+    return watched - len(get_watched(eumetsat=eumetsat))
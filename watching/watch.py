@@ -0,0 +1,109 @@
+""" `sdm watch` command requests offline products from the LTA and downloads them once they are online. """
+
+import time
+
+import click
+import urllib3
+import requests
+
+import meta.filters as filters
+import fetching.queue as queue
+import fetching.bulk as bulk
+import fetching.bandwidth as bandwidth
+import watching.lta as lta
+import configuration.exceptions as exceptions
+
+
+@click.command()
+@filters.product_filters
+@click.option('--resume', is_flag=True, help='Watch the queued products without queueing new ones.')
+@click.option('--once', is_flag=True, help='Check once instead of watching until all queued products are downloaded.')
+def watch(resume, once, **options):
+    """ Queue the products that match the filters, request the offline ones, and download them when online.
+
+    Notes:
+        All state is in the metadata database: the download queue, the product status, and when the products
+        were requested. Stopping and starting the watcher loses nothing. Failed checks are reported and retried
+        at the next check, and the interval grows as it does when nothing changes.
+
+    """
+
+    if not resume:
+        bulk.queue_products(options, default_statuses=('offline', 'requested', 'online'))
+
+    interval, _ = lta.get_intervals()
+    limit = bandwidth.get_limiter(bandwidth.get_bandwidth())
+
+    while True:
+        changed = False
+
+        try:
+            # EUMETSAT has no LTA, but its queued products may still be waiting to be downloaded
+            for eumetsat in [False, True]:
+                # carriage return, clear line
+                click.echo(f'\r\033[0J⏳ Checking the status of offline products', nl=False)
+                changed |= lta.poll(eumetsat=eumetsat) > 0
+
+                # carriage return, clear line
+                click.echo(f'\r\033[0J⏳ Requesting offline products from the LTA', nl=False)
+                requested, online = lta.request_products(eumetsat=eumetsat)
+                changed |= requested + online > 0
+        except exceptions.FailedRequestError as e:
+            # carriage return, clear line
+            click.secho('\r\033[0J⚙ ', fg='yellow', nl=False)
+            click.echo(f'Get request status code: {e.request.status_code} [{e.request.reason}]. Backing off.')
+        except (requests.RequestException, urllib3.exceptions.HTTPError) as e:
+            # carriage return, clear line
+            click.secho('\r\033[0J⚙ ', fg='yellow', nl=False)
+            click.echo(f'Request failed after all retries [{type(e).__name__}]. Backing off.')
+        except exceptions.MalformedFeedError as e:
+            # carriage return, clear line
+            click.secho('\r\033[0J⚙ ', fg='yellow', nl=False)
+            click.echo(f'The hub answered with a malformed feed [{e.reason}]. Backing off.')
+        except exceptions.NoAuthenticationFoundError:
+            # carriage return, clear line
+            click.secho('\r\033[0J⚙ ', fg='yellow', nl=False)
+            click.echo('No authentication found for the hub. Backing off.')
+
+        queued = queue.get_queued_products()
+
+        if queued:
+            try:
+                done, failed = bulk.download_products(queued, limit)
+            except exceptions.NoAuthenticationFoundError:
+                # carriage return, clear line
+                click.secho('\r\033[0J⚙ ', fg='yellow', nl=False)
+                click.echo('No authentication found for the hub. Backing off.')
+            else:
+                changed = True
+
+                # carriage return, clear line
+                click.secho('\r\033[0J✓ ', fg='green', nl=False)
+                click.echo(f'Downloaded {done} of {len(queued)} products' + (f', {failed} failed.' if failed else '.'))
+
+        watched = lta.get_watched(eumetsat=False) + lta.get_watched(eumetsat=True)
+
+        if not watched:
+            # carriage return, clear line
+            click.secho('\r\033[0J✓ ', fg='green', nl=False)
+            click.echo('No offline products left to watch.')
+            return
+
+        requested = len([product for product in watched if product['status'] == 'requested'])
+
+        if once:
+            # carriage return, clear line
+            click.secho('\r\033[0J⚙ ', fg='green', nl=False)
+            click.echo(f'Watching {len(watched)} offline products, {requested} requested from the LTA.')
+            return
+
+        interval = lta.get_next_interval(interval, changed)
+        wait_until = time.time() + interval
+
+        while time.time() < wait_until:
+            remaining = time.strftime('%H:%M:%S', time.gmtime(wait_until - time.time()))
+
+            # carriage return, clear line
+            click.echo(f'\r\033[0J⏳ Watching {len(watched)} offline products, {requested} requested', nl=False)
+            click.echo(f' [next check in {remaining}]', nl=False)
+            time.sleep(1)